@@ -0,0 +1,215 @@
+#!/usr/bin/env python3.4
+# -*- coding: utf-8 -*-
+import os
+import sys
+import io
+import json
+import math
+import time
+import random
+import platform
+import tempfile
+import subprocess
+import contextlib
+from argparse import ArgumentParser
+
+import functions
+import circles_graph
+
+"Time format of the generated data - the same as in the sample data."
+TIME_FORMAT = "[%Y/%m/%d %H:%M:%S]"
+
+"Time of the first generated row (2009/05/11 00:00:00 UTC), one row per second."
+START = 1242000000
+
+SHAPES = [ "sin", "walk" ]
+
+def generate_file(path, first, rows, shape, rng):
+    """Writes one data file with 'rows' rows starting at the row 'first'."""
+    value = 0.0
+    with open(path, "w", encoding = "utf-8") as data_file:
+        lines = []
+        for row in range(first, first + rows):
+            if shape == "sin":
+                value = 100 * math.sin(row * 2 * math.pi / 86400)
+            else:
+                value += rng.uniform(-1, 1)
+            lines.append("{} {:.3f}\n".format(time.strftime(TIME_FORMAT, time.gmtime(START + row)), value))
+            if len(lines) >= 65536:
+                data_file.write("".join(lines))
+                lines = []
+        data_file.write("".join(lines))
+
+def generate_data(data_dir, rows, files, shape):
+    """Generates data split into 'files' files that follow each other. Already generated data are reused."""
+    target = os.path.join(data_dir, "{}_{}_{}".format(shape, rows, files))
+    paths = [ os.path.join(target, "{:04d}.data".format(index)) for index in range(files) ]
+    if os.path.isdir(target):
+        return paths
+
+    tmp_dir = tempfile.mkdtemp(prefix = ".", dir = data_dir)
+    rng = random.Random(rows * files)
+    first = 0
+    for index in range(files):
+        count = rows // files + (1 if index < rows % files else 0)
+        generate_file(os.path.join(tmp_dir, os.path.basename(paths[index])), first, count, shape, rng)
+        first += count
+    os.rename(tmp_dir, target)
+    return paths
+
+def make_settings(paths, name, jobs):
+    """Returns settings of a run with the default values. They are parsed the same way as the command line of the script."""
+    args = [ "-t", TIME_FORMAT, "-E", "-n", name, "-j", str(jobs), "--NoCache" ] + paths
+    return circles_graph.parse_settings(args, circles_graph.default_constants())
+
+class Stages(object):
+    """Measures wall time of the pipeline stages."""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Adds wall time of the block to the stage."""
+        start = time.perf_counter()
+        yield
+        self.times[name] = self.times.get(name, 0) + time.perf_counter() - start
+
+def run_pipeline(paths, work_dir, video, jobs):
+    """Runs all stages of the pipeline on the given files. Returns times of the stages and sizes of their outputs."""
+    settings = make_settings(paths, "benchmark", jobs)
+    stages = Stages()
+    counters = {}
+
+    "Files are read and validated the same way as by the script - memory-mapped, in parallel if more jobs are allowed."
+    with stages.stage("validate_inputs"):
+        suitable_data = [ rows for i_file, rows in functions.validate_inputs(settings) ]
+    counters["rows"] = sum([ len(rows) for rows in suitable_data if rows ])
+
+    with stages.stage("merge_data"):
+        data = functions.merge_data([ rows for rows in suitable_data if rows ], settings)
+    del suitable_data
+    counters["series"] = len(data)
+
+    "The same preparation as in 'process_data'."
+    xmin = min([ i_data.times[0] for i_data in data ])
+    xmax = max([ i_data.times[-1] for i_data in data ])
+    count = sum([ math.ceil(len(i_data) / 2) for i_data in data ])
+    settings["columns"] = min(count, 30)
+    distance = (xmax - xmin) / settings["columns"]
+
+    with stages.stage("select_drawable_data"):
+        selected = [ functions.select_drawable_data(i_data, distance, settings) for i_data in data ]
+    res_output = [ res[0] for res in selected ]
+    ymax = max([ res[1] for res in selected ])
+    ymin = min([ res[2] for res in selected ])
+    jump = (ymax - ymin) / settings["steps"]
+    ymax = 0 if ymax <= 0 and ymax + 20 * jump > 0 else ymax + 20 * jump
+    ymin = 0 if ymin >= 0 and ymin - 20 * jump < 0 else ymin - 20 * jump
+    counters["buckets"] = sum([ len(i_data) for i_data in res_output ])
+
+    with stages.stage("count_frames"):
+        real_frames = max([ functions.count_frames(i_data, ymax, ymin, jump, settings["delay"]) for i_data in res_output ])
+    digits = len(str(real_frames))
+
+    "Frames are kept so the rendering stages do not measure generating them again, the positions are copied as they are reused by the next frame."
+    with stages.stage("generate_frames"), contextlib.redirect_stdout(io.StringIO()):
+        animation = functions.prepare_animation(res_output, ymin, ymax, settings)
+        frames = [ (counter, state and [ (times, values[:]) for times, values in state ]) for counter, state in functions.generate_frames(animation, jump, real_frames, settings) ]
+    counters["frames"] = len(frames)
+    counters["duplicate_frames"] = len([ state for counter, state in frames if state is None ])
+
+    if video:
+        scene = {
+            "gnuplot": 'set term png truecolor\nset key off\nset xrange [{}:{}]\nset yrange [{}:{}]\n'.format(xmin, xmax, ymin, ymax),
+            "series": len(res_output),
+            "colors": [ "black" ] * len(res_output),
+            "xrange": (xmin, xmax),
+            "yrange": (ymin, ymax)
+        }
+        with tempfile.TemporaryDirectory(dir = work_dir) as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                with stages.stage("render_frames"):
+                    functions.render_frames(functions.open_renderer(scene, settings, False), frames, tmp_dir, digits)
+                with stages.stage("generate_video"):
+                    functions.generate_video(settings, digits, tmp_dir)
+            finally:
+                os.chdir(cwd)
+
+    return stages.times, counters
+
+def measure_startup(repeat):
+    """Returns the shortest wall time of starting the script and of importing its functions."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "version": [ sys.executable, os.path.join(here, "circles_graph.py"), "--version" ],
+        "import_functions": [ sys.executable, "-c", "import functions" ]
+    }
+    startup = {}
+    for name, command in sorted(commands.items()):
+        best = None
+        for i in range(max(1, repeat)):
+            start = time.perf_counter()
+            subprocess.check_call(command, cwd = here, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        startup[name] = best
+    return startup
+
+def revision():
+    """Returns git revision of the benchmarked code or None."""
+    try:
+        output = subprocess.check_output([ "git", "rev-parse", "HEAD" ], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Measures time of each stage of the pipeline on generated data. Results are written as JSON so they can be compared between versions.")
+    parser.add_argument('-r', '--Rows', dest='rows', type=int, nargs='+', default=[ 1000, 100000 ], help='Numbers of generated rows (1e3 - 1e7).')
+    parser.add_argument('-n', '--Files', dest='files', type=int, nargs='+', default=[ 1, 10 ], help='Numbers of files the rows are split into (1 - 1000).')
+    parser.add_argument('-s', '--Shape', dest='shapes', nargs='+', choices=SHAPES, default=SHAPES, help='Shapes of the generated series.')
+    parser.add_argument('-R', '--Repeat', dest='repeat', type=int, default=3, help='Sets how many times each case runs, the fastest run is reported.')
+    parser.add_argument('-j', '--Jobs', dest='jobs', type=int, default=1, help='Sets how many processes parse the input files.')
+    parser.add_argument('-d', '--DataDir', dest='data_dir', help='Directory for the generated data, they are reused between runs.')
+    parser.add_argument('-o', '--Output', dest='output', help='Output JSON file. Default is stdout.')
+    parser.add_argument('--Video', dest='video', action='store_true', help='Also renders frames and generates the video (needs gnuplot and ffmpeg).')
+    parser.add_argument('--Startup', dest='startup', action='store_true', help='Also measures startup time of the script.')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), "circles_graph_benchmark")
+    os.makedirs(data_dir, exist_ok = True)
+
+    results = []
+    for shape in args.shapes:
+        for rows in args.rows:
+            for files in args.files:
+                if files > rows:
+                    continue
+                print("Benchmarking {} rows of '{}' in {} files...".format(rows, shape, files), file = sys.stderr)
+                paths = generate_data(data_dir, rows, files, shape)
+                best = None
+                for repeat in range(max(1, args.repeat)):
+                    times, counters = run_pipeline(paths, data_dir, args.video, max(1, args.jobs))
+                    best = times if not best else { stage: min(best[stage], times[stage]) for stage in times }
+                results.append({ "shape": shape, "rows": rows, "files": files, "stages": best, "counters": counters })
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "jobs": args.jobs,
+        "results": results
+    }
+    if args.startup:
+        print("Benchmarking startup...", file = sys.stderr)
+        report["startup"] = measure_startup(max(10, args.repeat))
+
+    if args.output:
+        with open(args.output, "w", encoding = "utf-8") as output:
+            json.dump(report, output, indent = 2, sort_keys = True)
+    else:
+        print(json.dumps(report, indent = 2, sort_keys = True))
@@ -1,31 +1,15 @@
 #!/usr/bin/env python3.4
 # -*- coding: utf-8 -*-
 import os
-import subprocess
+import sys
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
-from datetime import datetime
-import urllib.request
-from urllib.error import URLError, HTTPError
 
 import functions
 
-if __name__ == '__main__':
-    executables = [ "ffmpeg", "gnuplot" , "wget" ]
-
-    for prg in executables:
-        try:
-            f_null = open(os.devnull, 'w')
-            subprocess.Popen([prg, "--help"], stdout=f_null, stderr=f_null)
-        except OSError as e:
-            if e.errno == os.errno.ENOENT:
-                print("ERROR: '" + prg + "' is not installed")
-                sys.exit()
-            else:
-                print("ERROR: something went wrong when running '" + prg + "'")
-                sys.exit()
-
-    constants = {
+def default_constants():
+    """Returns default values of all settings."""
+    return {
         "time_format": "[%Y-%m-%d %H:%M:%S]",
         "max_columns": 30,
         "speed": 1,
@@ -40,9 +24,22 @@ if __name__ == '__main__':
         "max_time": "max",
         "method": "average",
         "steps": 50,
+        "jobs": 1,
+        "stream": "auto",
+        "stream_frames": 500,
+        "renderer": "gnuplot",
+        "preview_size": "320,240",
+        "output_dir": ".",
+        "follow_interval": 2,
+        "segment_frames": 250,
+        "workers": 1,
+        "cache_size": 1024,
+        "cache_dir": os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "circles_graph"),
         "colors": [ "web-green", "black", "dark-grey", "red", "web-blue", "dark-magenta","dark-cyan", "dark-orange", "dark-yellow", "royalblue", "goldenrod", "dark-spring-green", "purple", "steelblue", "dark-red", "dark-chartreuse", "orchid", "aquamarine", "brown", "yellow", "turquoise", "grey0", "grey10", "grey20", "grey30", "grey40", "grey50", "grey60", "grey70", "grey", "grey80", "grey90", "grey100", "light-red", "light-green", "light-blue", "light-magenta", "light-cyan", "light-goldenrod", "light-pink", "light-turquoise", "gold", "green", "dark-green", "spring-green", "forest-green", "sea-green", "blue", "dark-blue", "midnight-blue", "navy", "medium-blue", "skyblue", "cyan", "magenta", "dark-turquoise", "dark-pink", "coral", "light-coral", "orange-red", "salmon", "dark-salmon", "khaki", "dark-khaki", "dark-goldenrod", "beige", "olive", "orange", "violet", "dark-violet", "plum", "dark-plum", "dark-olivegreen", "orangered4", "brown4", "sienna4", "orchid4", "mediumpurple3", "slateblue1", "yellow4", "sienna1", "tan1", "sandybrown", "light-salmon", "pink", "khaki1", "lemonchiffon", "bisque", "honeydew", "slategrey", "seagreen", "antiquewhite", "chartreuse", "greenyellow", "gray", "light-gray", "light-grey", "dark-gray", "slategray", "gray0", "gray10", "gray20", "gray30", "gray40", "gray50", "gray60", "gray70", "gray80", "gray90", "gray100" ]
     }
 
+def parse_settings(argv, constants):
+    """Parses command line arguments and the config file. Returns checked settings."""
     settings = {
         "delay": constants["delay"],
         "method": constants["method"],
@@ -61,22 +58,41 @@ if __name__ == '__main__':
     parser.add_argument('-S', '--Speed', dest='speed', help='Says how many rows of the data fits one frame.')
     parser.add_argument('-T', '--Time', dest='time', help='Says how long the animation should be.')
     parser.add_argument('-F', '--FPS', dest='fps', help='Sets frame per seconds.')
+    parser.add_argument('-j', '--Jobs', dest='jobs', help='Sets how many processes parse input files and how many gnuplot processes render frames in parallel.')
+    parser.add_argument('-s', '--Stream', dest='stream', help='Sets how frames are passed to ffmpeg. Options are "pipe", "files" or "auto" (pipe for long animations).')
+    parser.add_argument('-r', '--Renderer', dest='renderer', help='Sets how frames are drawn. Options are "gnuplot" or "raster" (in-process drawing over a background rendered once by gnuplot, ignores -g point settings).')
+    parser.add_argument('--Frames', dest='frames', help='Renders only frames A to B (format "A:B", B can be omitted) into a lossless video segment "<name>/segments/<name>.A-B.mkv".')
+    parser.add_argument('-p', '--Preview', dest='preview', help='Renders a quick preview "<name>.preview.mp4" - every N-th frame in a reduced size and the fastest encoder preset.')
+    parser.add_argument('--Follow', dest='follow', help='Keeps following the input files and extends the animation by the appended data every SECONDS. Video is written as HLS segments with a playlist "<name>.m3u8". Runs until interrupted.')
+    parser.add_argument('--Stitch', dest='stitch', action='store_true', help='Inputs are video segments rendered with --Frames, they are joined into the final video. Segments from one "segments" directory are joined into "<name>.mp4" next to it.')
     parser.add_argument('-l', '--Legend', dest='legend', help='Sets title of the graph.')
     parser.add_argument('-g', dest='gnuplot', action='append', help='Specify your own gnuplot params. Available areonly those starting with "set" and "unset"')
     parser.add_argument('-e', dest='effect', action='append', help='Specify effect parameters. Available options are in the documentation.')
     parser.add_argument('-f', '--ConfigFile', dest='config', type=functions.check_pathname, help='Specify file with configuratinon.')
     parser.add_argument('-n', '--Name', dest='name', help='Sets name of the input directory and animation.')
+    parser.add_argument('-o', '--OutputDir', dest='output_dir', help='Sets directory where the directory with the animation is created. Default is the current directory.')
+    parser.add_argument('--Daemon', dest='daemon', help='Runs as a daemon that renders jobs posted over HTTP to the address "[host:]port" (host defaults to 127.0.0.1). Input files are not needed. Parsed inputs are kept in memory up to --CacheSize.')
+    parser.add_argument('--Workers', dest='workers', help='Sets how many jobs the daemon renders at the same time.')
     parser.add_argument('-E', '--IgnoreError', dest='ignore_error', action='store_true', help='If set not critical errors are shown as WARNING and script continues.')
+    parser.add_argument('--CacheDir', dest='cache_dir', help='Sets directory of the persistent cache (downloaded files etc.).')
+    parser.add_argument('--CacheSize', dest='cache_size', help='Sets size limit of the persistent cache in MB. Least recently used entries are removed first.')
+    parser.add_argument('--NoCache', dest='no_cache', action='store_true', help='If set the persistent cache is neither used nor updated.')
+    parser.add_argument('--Profile', dest='profile', help='Writes JSON report with time and memory spent in each stage and counters of the processed data to the file.')
+    parser.add_argument('--ProfileStats', dest='profile_stats', help='Also profiles the Python code and writes cProfile statistics (pstats) to the file. Needs --Profile.')
     parser.add_argument('-v', '--Verbose', dest='verbose', action='count', help='Sets level of verbose. Maximum is 2.')
-    parser.add_argument('input', type=functions.check_file, action='append', nargs='+', help='Specify input data files.')
+    parser.add_argument('input', type=functions.check_file, action='append', nargs='*', help='Specify input data files.')
+
+    args = parser.parse_args(argv)
 
-    args = parser.parse_args()
+    if not args.daemon and not args.input[0]:
+        parser.error("the following arguments are required: input")
 
     user = vars(args)
 
     "Copy arguments the the dict settings"
-    for key in ["time_format", "max_val", "min_val", "max_time", "min_time", "speed", "time", "fps", "legend", "gnuplot", "effect", "config", "name", "ignore_error", "verbose", "input"]:
+    for key in ["time_format", "max_val", "min_val", "max_time", "min_time", "speed", "time", "fps", "jobs", "stream", "renderer", "legend", "gnuplot", "effect", "config", "name", "ignore_error", "verbose", "input", "cache_dir", "cache_size", "profile", "profile_stats", "frames", "preview", "follow", "stitch", "output_dir", "daemon", "workers"]:
         settings[key] = user[key]
+    settings["cache"] = not user["no_cache"]
 
     "Loads config file"
     if settings["config"]:
@@ -102,7 +118,7 @@ if __name__ == '__main__':
         settings["speed"] = constants["speed"]
 
     "Using default values if they have not been set by the user."
-    for key in ["time_format", "max_val", "min_val", "max_time", "min_time", "name", "ignore_error", "verbose" ]:
+    for key in ["time_format", "max_val", "min_val", "max_time", "min_time", "name", "ignore_error", "verbose", "jobs", "stream", "renderer", "cache_dir", "cache_size", "output_dir", "workers" ]:
         if not settings[key]:
             settings[key] = constants[key]
 
@@ -122,6 +138,25 @@ if __name__ == '__main__':
     if settings["speed"]:
         settings["speed"] = functions.check_speed(settings, constants)
 
+    settings["jobs"] = functions.check_jobs(settings, constants)
+    settings["stream"] = functions.check_stream(settings, constants)
+    settings["renderer"] = functions.check_renderer(settings, constants)
+    settings["cache_size"] = functions.check_cache_size(settings, constants)
+    settings["output_dir"] = functions.check_output_dir(settings, constants)
+
+    if settings["daemon"]:
+        settings["daemon"] = functions.check_daemon(settings)
+        settings["workers"] = functions.check_workers(settings, constants)
+
+    if settings["frames"]:
+        settings["frames"] = functions.check_frames(settings)
+
+    if settings["preview"]:
+        settings["preview"] = functions.check_preview(settings)
+
+    if settings["follow"]:
+        settings["follow"] = functions.check_follow(settings, constants)
+
     if settings["legend"]:
         settings["legend"] = functions.check_legend(settings["legend"])
 
@@ -145,129 +180,68 @@ if __name__ == '__main__':
         settings["max_time"] = constants["max_time"]
         settings["min_val"] = constants["min_time"]
 
-    "Loading data from files"
-    data = {}
-    for input_file in settings["input"][0]:
-        if "http" in input_file:
-            "All files starting with 'http'"
-            file_name = input_file[input_file.rfind("/"):]
-            functions.verbose("Downloading file '{}'".format(input_file), settings["verbose"], 2)
-            try:
-                with urllib.request.urlopen(input_file) as i_file:
-                    data[input_file] = functions.load_data_file(i_file)
-                    if not data[input_file]:
-                        del data[input_file]
-                        
-            except HTTPError as e:
-                functions.soft_error("ERROR: The server couldn\'t fulfill the request.", settings["verbose"], 1, settings["ignore_error"])
-                functions.verbose(" - error code: {}".format(e.code), settings["verbose"], 1)
-            except URLError as e:
-                functions.soft_error("ERROR: We failed to reach a server.", settings["verbose"], 1, settings["ignore_error"])
-                functions.verbose(" - reason: {}".format(e.code), settings["verbose"], 1)
-        else:
-            functions.verbose("Opening file '{}'".format(input_file), settings["verbose"], 2)
-            with open(input_file, mode='rb') as i_file:
-                data[input_file] = functions.load_data_file(i_file)
-                if not data[input_file]:
-                        del data[input_file]
-
-    if len(data) == 0:
-        functions.error("No input data were loaded.")
+    return settings
+
+def render(settings, constants, prune = True):
+    """Runs one render described by the settings. Returns message about the generated video.
+
+    The size limit of the cache is enforced at the end unless 'prune' is False - when other renders may use the cache.
+    """
+    "Programs are only looked up in PATH, they are started when they are needed."
+    functions.require_program("ffmpeg")
+    if not settings["stitch"]:
+        functions.require_program("gnuplot")
+
+    if settings["profile"]:
+        functions.PROFILE.start(bool(settings["profile_stats"]))
 
-    functions.verbose("Validating input files data...", settings["verbose"], 2)
+    if settings["stitch"]:
+        message = functions.stitch_video(settings, settings["input"][0])
+        print(message)
+    elif settings["follow"]:
+        message = functions.follow_video(settings, constants)
+    else:
+        message = render_data(settings, constants)
+
+    "All kinds of the cache entries are written during the render, the size limit is enforced once at its end."
+    if prune:
+        functions.prune_cache(settings)
+
+    if settings["profile"]:
+        functions.PROFILE.write(settings["profile"], settings["profile_stats"])
 
+    return message
+
+def render_data(settings, constants):
+    """Loads and validates the input data and renders the video. Returns message about the generated video."""
+    functions.verbose("Loading and validating input files data...", settings["verbose"], 2)
+
+    loaded = 0
     suitable_data = []
 
     "Checks data from input files - if the time is in correct format, order an if the values are numeric."
-    for index_file, i_file in enumerate(data):
-        lines = len(data[i_file])
-        prev = 0
-        suitable_data.append("")
-        for index_line, line in enumerate(data[i_file]):
-            if line == "":
-                continue
-            delim = line.rfind(" ")
-            time = line[:delim].strip()
-            value = line[delim+1:]
-            
-            "Returns 1 for error in time and 2 for error in value."
-            res = functions.check_data_line(time, value, settings["time_format"])
-            if res == 1:
-                functions.soft_error("WARNING: file '{}':\n - line #{}: wrong time format.".format(i_file, index_line+1), settings["verbose"], 1, settings["ignore_error"])
-                functions.verbose(" - skipping", settings["verbose"], 1)
-            elif res == 2:
-                functions.soft_error("WARNING: file '{}':\n - line #{}: wrong value.".format(i_file, index_line+1), settings["verbose"], 1, settings["ignore_error"])
-                functions.verbose(" - skipping", settings["verbose"], 1)
-
-            "Checks another mistakes in date (month # 13 etc.)"
-            try:
-                time = int(datetime.strptime(time, settings["time_format"]).strftime('%s')) + int(datetime.today().strftime('%s')) - int(datetime.utcnow().strftime('%s'))
-            except ValueError:
-                functions.soft_error("WARNING: file '{}':\n - line #{}: wrong date.".format(i_file, index_line+1), settings["verbose"], 1, settings["ignore_error"])
-                functions.verbose(" - skipping", settings["verbose"], 1)
-                continue
-            
-            "Skip if the time is out of desired range."
-            if settings["min_time"] not in [ "min" ] and time < settings["min_time"]:
-                continue
-            elif settings["max_time"] not in [ "max" ] and time > settings["max_time"]:
-                continue
-
-            size = len(suitable_data)
-            "If not first row in the file we have to check the order."
-            if index_line == 0:
-                suitable_data[size-1] = "{} {}".format(time, value)
-            else:
-                if time - prev <= 0:
-                    functions.soft_error("WARNING: file '{}':\n - line #{}: wrong order of the input data.".format(i_file, index_line+1), settings["verbose"], 1, settings["ignore_error"])
-                    functions.verbose(" - skipping", settings["verbose"], 1)
-                    continue
-                suitable_data[size-1] = suitable_data[size-1] + "\n{} {}".format(time, value)
-            prev = time
-        
-        if suitable_data[len(suitable_data)-1] == "":
-            functions.soft_error("WARNING: file '{}':\n - no suitable data found.".format(i_file), settings["verbose"], 1, settings["ignore_error"])
-            del suitable_data[len(suitable_data)-1]
+    "Remote files are downloaded in the background while the local ones are checked."
+    for i_file, rows in functions.validate_inputs(settings):
+        loaded += 1
+        if rows:
+            suitable_data.append(rows)
+
+    if loaded == 0:
+        functions.error("No input data were loaded.")
 
     if len(suitable_data) == 0:
         functions.error("ERROR: No suitable data found in any of the input files.")
 
-    """Sorts input files using the date. (bubble sort)"""
-    for index_file in range(len(suitable_data)-1, 0, -1):
-        for i in range(index_file):
-            time = suitable_data[i].split()[0]
-            timeNext = suitable_data[i+1].split()[0]
-            if time > timeNext:
-                tmp = suitable_data[i]
-                suitable_data[i] = suitable_data[i+1]
-                suitable_data[i+1] = tmp
-
-    """Checks overlaping of the dates in all input files."""
-    overlaping = False
-    for index, i_data in enumerate(suitable_data):
-        if index == 0:
-            continue
-        prevEnd = suitable_data[index-1].split()[-2:-1][0]
-        start = suitable_data[index].split()[0]
-        if start <= prevEnd:
-            overlaping = True
-            break
-
-    if not overlaping:
-        functions.verbose("One curve for all input files in one graph will be generated.", settings["verbose"], 1)
-        joinedData = ""
-
-        """File are not overlaping - we can merge the data."""
-        for index, i_data in enumerate(suitable_data):
-            joinedData += "\n" + i_data if index > 0 else i_data
-
-        data = [ joinedData ]
-        
-        functions.process_data(data, settings, constants)
-
-    else:
-        functions.verbose("One curve for each input file in one graph will be generated.", settings["verbose"], 1)
+    data = functions.merge_data(suitable_data, settings)
 
-        data = suitable_data
+    return functions.process_data(data, settings, constants)
 
-        functions.process_data(data, settings, constants)
+if __name__ == '__main__':
+    constants = default_constants()
+    settings = parse_settings(sys.argv[1:], constants)
+    if settings["daemon"]:
+        "The HTTP server is imported only when it is needed."
+        import daemon
+        daemon.serve(settings, constants, parse_settings, render)
+    else:
+        render(settings, constants)
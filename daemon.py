@@ -0,0 +1,169 @@
+import os
+import json
+import queue
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import functions
+
+class RenderDaemon(object):
+    """Queue of render jobs processed by worker threads of a long-running process."""
+
+    def __init__(self, settings, constants, parse_settings, render):
+        self.settings = settings
+        self.constants = constants
+        self.parse_settings = parse_settings
+        self.render = render
+        self.jobs = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+        "Settings are parsed relative to the directory of the job, the current directory is shared by all threads."
+        self.parse_lock = threading.Lock()
+        "Cache is pruned only when no job is running, so no entry is removed while a job reads it."
+        self.cache = threading.Condition()
+        self.running = 0
+        self.pruning = False
+        self.prune_pending = {}
+        self.queue = queue.Queue()
+        self.workers = [ functions.start_thread(self.work) for i in range(self.settings["workers"]) ]
+
+    def submit(self, args, cwd):
+        """Adds job with the command line arguments and the working directory to the queue. Returns description of the job."""
+        with self.lock:
+            self.counter += 1
+            job = { "id": self.counter, "args": args, "cwd": cwd, "state": "queued", "message": None }
+            self.jobs[job["id"]] = job
+        self.queue.put(job)
+        return dict(job)
+
+    def status(self, job_id = None):
+        """Returns description of the job or of all jobs. Returns None if there is no such job."""
+        with self.lock:
+            if job_id is None:
+                return [ dict(job) for job in self.jobs.values() ]
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job, state, message = None):
+        """Changes state of the job."""
+        with self.lock:
+            job["state"] = state
+            job["message"] = message
+        functions.verbose("Job {} {}.".format(job["id"], state), self.settings["verbose"], 1)
+
+    def parse(self, job):
+        """Parses settings of the job. Paths in them are made absolute."""
+        with self.parse_lock:
+            cwd = os.getcwd()
+            os.chdir(job["cwd"])
+            try:
+                settings = self.parse_settings(job["args"], self.constants)
+                settings["output_dir"] = os.path.abspath(settings["output_dir"])
+                settings["cache_dir"] = os.path.abspath(settings["cache_dir"])
+            finally:
+                os.chdir(cwd)
+        if settings["daemon"] or settings["profile"] or settings["follow"]:
+            raise ValueError("options --Daemon, --Profile and --Follow can not be used in jobs")
+        return settings
+
+    def begin(self):
+        """Waits until the cache is not being pruned and marks the job as running."""
+        with self.cache:
+            while self.pruning:
+                self.cache.wait()
+            self.running += 1
+
+    def end(self, settings):
+        """Marks the job as finished. The last running job prunes the caches used by the jobs since the last pruning."""
+        with self.cache:
+            self.running -= 1
+            if settings and settings["cache"]:
+                self.prune_pending[settings["cache_dir"]] = settings
+            if self.running or not self.prune_pending:
+                return
+            pending = list(self.prune_pending.values())
+            self.prune_pending = {}
+            self.pruning = True
+        try:
+            for settings in pending:
+                functions.prune_cache(settings)
+        finally:
+            with self.cache:
+                self.pruning = False
+                self.cache.notify_all()
+
+    def work(self):
+        """Renders jobs from the queue."""
+        while True:
+            job = self.queue.get()
+            self.update(job, "running")
+            settings = None
+            self.begin()
+            try:
+                settings = self.parse(job)
+                self.update(job, "done", self.render(settings, self.constants, False))
+            except SystemExit:
+                self.update(job, "failed", "Job stopped on an error, see output of the daemon.")
+            except Exception as e:
+                self.update(job, "failed", str(e))
+            finally:
+                self.end(settings)
+
+class DaemonServer(ThreadingMixIn, HTTPServer):
+    """HTTP server of the daemon, each request is handled in its own thread."""
+    daemon_threads = True
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """Handles requests to the daemon - POST /jobs adds a job, GET /jobs and GET /jobs/<id> return their state."""
+
+    def reply(self, code, content):
+        """Sends the content as JSON."""
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == [ "jobs" ]:
+            self.reply(200, self.server.jobs.status())
+        elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit() and self.server.jobs.status(int(parts[1])):
+            self.reply(200, self.server.jobs.status(int(parts[1])))
+        else:
+            self.reply(404, { "error": "not found" })
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self.reply(404, { "error": "not found" })
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+            args = request["args"]
+            cwd = request.get("cwd", os.getcwd())
+            if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args) or not os.path.isdir(cwd):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self.reply(400, { "error": "expected JSON object with a list of arguments 'args' and an existing directory 'cwd'" })
+            return
+        self.reply(202, self.server.jobs.submit(args, os.path.abspath(cwd)))
+
+    def log_message(self, format, *args):
+        functions.verbose(format % args, self.server.jobs.settings["verbose"], 2)
+
+def serve(settings, constants, parse_settings, render):
+    """Runs the daemon until it is interrupted. Jobs are parsed and rendered by the given functions."""
+    "Parsed input series are kept in memory between the jobs, they take at most the size limit of the cache."
+    if settings["cache"]:
+        functions.keep_inputs_warm(settings["cache_size"] * 1024 * 1024)
+    server = DaemonServer(settings["daemon"], DaemonHandler)
+    server.jobs = RenderDaemon(settings, constants, parse_settings, render)
+    print("Daemon is listening on http://{}:{}/jobs".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
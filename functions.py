@@ -6,9 +6,325 @@ import tempfile
 import math
 import random
 import shlex
+import zlib
+import mmap
+import json
+import hashlib
+import shutil
+import bisect
+import struct
+import queue
+import threading
+import time
+import contextlib
+import collections
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+try:
+    import resource
+except ImportError:
+    resource = None
+
+"Options of the time format that can be parsed without 'strptime'."
+TIME_FIELDS = "YymdHMS"
+
+"Compiled timestamp parsers, one for each time format."
+TIME_PARSERS = {}
+
+"Methods computing height of one column from the values of its rows."
+METHODS = {
+    "average": lambda values: exact_sum(values) / len(values),
+    "top": lambda values: max(values, key = math.fabs),
+    "min": min,
+    "max": max,
+    "sum": lambda values: exact_sum(values),
+    "count": lambda values: float(len(values)),
+    "median": lambda values: median(values),
+    "last": lambda values: values[-1]
+}
+
+"Methods that reduce columns from the pre-aggregated blocks of 'SeriesIndex' and the kind of the blocks they need."
+INDEX_KINDS = {
+    "average": "sum",
+    "sum": "sum",
+    "min": "min",
+    "max": "max",
+    "top": "top",
+    "count": None,
+    "last": None
+}
+
+"Smallest blocks of the index have 2^INDEX_LEAF rows, shorter runs of rows are reduced directly."
+INDEX_LEAF = 4
+
+"Blocks of the 'sum' index keep up to INDEX_TERMS values whose exact sum is the exact sum of their rows."
+INDEX_TERMS = 3
+
+"Header of the index files - magic, id of the series cache entry, number of the indexed rows and of the levels."
+INDEX_HEADER = "<4s16sQQ"
+INDEX_MAGIC = b"CGI2"
+
+"Marks a frame that repeats the previous image in the queue of frames sent to ffmpeg."
+DUPLICATE = -1
+RENDERED = 0
+
+"Row of the inline data of the gnuplot plot command and the end of the data."
+ROW_FORMAT = "{} {}\n"
+END_OF_DATA = b"e\n"
+
+"Point markers of the raster renderer, one for each curve."
+MARKERS = []
+
+"Maximal number of files downloaded at once."
+DOWNLOAD_THREADS = 8
+
+"Header of the binary series files - magic, type codes of times and values and number of rows."
+SERIES_HEADER = "<4sccQ"
+SERIES_MAGIC = b"CGSR"
+
+"Approximate size of the input chunks (in bytes) decoded and validated at once."
+CHUNK_BYTES = 1 << 20
+
+"Size of the byte ranges (in bytes) of large input files parsed by separate processes."
+RANGE_BYTES = 16 << 20
+
+"Parts of the input (in bytes) searched for a time that are scanned line by line instead of being halved again."
+SEEK_BYTES = 1 << 14
+
+"Problem of the rows that are not later than the previous suitable row."
+ORDER_PROBLEM = "wrong order of the input data."
+
+"Size of the blocks in which the cached part of the input is hashed to find out that the file only grew."
+FINGERPRINT_BYTES = 1 << 20
+
+"Entries of the series cache kept in memory by a long-running process (see 'keep_inputs_warm'), None if they are not kept."
+"Their series take up to 'WARM_INPUTS_LIMIT' bytes, 'WARM_INPUTS_SIZE' bytes are taken now."
+WARM_INPUTS = None
+WARM_INPUTS_LIMIT = 0
+WARM_INPUTS_SIZE = 0
+WARM_INPUTS_LOCK = threading.Lock()
+
+"Target directories of parallel renders are created one at a time."
+TARGET_LOCK = threading.Lock()
+
+"Commands printing features of the programs, see 'program_features'."
+PROGRAM_PROBES = {
+    "ffmpeg": { "version": [ "-version" ], "encoders": [ "-hide_banner", "-encoders" ] },
+    "gnuplot": { "version": [ "--version" ], "terminals": [ "-e", "set terminal" ] }
+}
+
+"Patterns of the names of the features in the output of the probes."
+FEATURE_PATTERNS = {
+    "encoders": re.compile(r"^ [VAS][.A-Z]{5} (\w\S*)", re.M),
+    "terminals": re.compile(r"^ +(\S+) +\S", re.M)
+}
+
+"Time limit (in seconds) of one probe of a program."
+PROBE_TIMEOUT = 10
+
+"Features of the probed programs by their path, modification time and size."
+PROGRAMS = {}
+PROGRAMS_LOCK = threading.Lock()
+
+"Directory of the video segments rendered with '--Frames', it is inside the directory of the video named by '--Name'."
+SEGMENTS_DIR = "segments"
+
+"Frame rate of the input images assumed by ffmpeg, the output frame rate is set by '-r'."
+IMAGE_FPS = 25
+
+class Profile(object):
+    """Collects time and memory spent in the stages of the run and counters of the processed items.
+
+    Stages may be nested, time of the inner stage is part of the outer one too. Nothing is recorded until 'start' is called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.profiler = None
+
+    def start(self, stats = False):
+        """Starts recording. If 'stats' is set the Python code is also profiled by cProfile."""
+        self.enabled = True
+        self.started = (time.perf_counter(), time.process_time())
+        if stats:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Adds wall and CPU time of the block to the stage."""
+        if not self.enabled:
+            yield
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self.lock:
+                stage = self.stages.setdefault(name, { "calls": 0, "wall": 0.0, "cpu": 0.0 })
+                stage["calls"] += 1
+                stage["wall"] += wall
+                stage["cpu"] += cpu
+                stage["max_rss_kb"] = max_rss()
+
+    def count(self, name, amount = 1):
+        """Adds amount to the counter."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        """Returns everything recorded so far."""
+        total = {
+            "wall": time.perf_counter() - self.started[0],
+            "cpu": time.process_time() - self.started[1],
+            "max_rss_kb": max_rss()
+        }
+        if resource:
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            total["children_cpu"] = children.ru_utime + children.ru_stime
+        with self.lock:
+            return { "total": total, "stages": dict(self.stages), "counters": dict(self.counters) }
+
+    def write(self, path, stats_path = None):
+        """Writes the report as JSON and the cProfile statistics if they were collected."""
+        if self.profiler:
+            self.profiler.disable()
+            if stats_path:
+                self.profiler.dump_stats(stats_path)
+        with open(path, "w", encoding = "utf-8") as report_file:
+            json.dump(self.report(), report_file, indent = 2, sort_keys = True)
+
+"Profile of the current run, see '--Profile'."
+PROFILE = Profile()
+
+def max_rss():
+    """Returns the highest memory usage of the process so far in kB or None if it is not known."""
+    if not resource:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    "macOS reports bytes, other systems kB."
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+class Series(object):
+    """Time series stored in two parallel arrays - times (seconds) and values.
+
+    'indexed' lists rows covered by an index of the series cache (see 'SeriesIndex') - tuples of the first and after
+    the last row, shift of the row numbers in the indexed series and the source of the index.
+    """
+    __slots__ = ("times", "values", "indexed")
+
+    def __init__(self, times = None, values = None, indexed = None):
+        self.times = array('q') if times is None else times
+        self.values = array('d') if values is None else values
+        self.indexed = indexed or []
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, time, value):
+        """Appends one row."""
+        self.times.append(time)
+        self.values.append(value)
+
+    def extend(self, other):
+        """Appends all rows of another series."""
+        self.indexed = self.indexed + [ (start + len(self), stop + len(self), shift - len(self), source) for start, stop, shift, source in other.indexed ]
+        self.times.extend(other.times)
+        self.values.extend(other.values)
+
+    def window(self, start, stop):
+        """Returns rows 'start' to 'stop' (excluded) as a new series."""
+        indexed = [ (max(first, start) - start, min(last, stop) - start, shift + start, source) for first, last, shift, source in self.indexed if first < stop and last > start ]
+        return Series(self.times[start:stop], self.values[start:stop], indexed)
+
+class SeriesIndex(object):
+    """Pyramid of values pre-aggregated by one kind of reduction over blocks of 2^k rows of a series.
+
+    Any run of rows is covered by O(log n) blocks, so a column is reduced without reading all of its rows.
+    Blocks are built only from complete runs of rows, rows appended later extend the pyramid.
+    Sums are kept exactly (see 'exact_terms'), so columns get the same heights as without the index.
+    Blocks that could not be pre-aggregated are NaN, their rows are used instead.
+    """
+
+    def __init__(self, kind, rows = 0, levels = None):
+        self.kind = kind
+        self.rows = rows
+        self.levels = levels or [ array('d') ]
+        "Number of the values of one block."
+        self.width = INDEX_TERMS if kind == "sum" else 1
+
+    def block(self, values):
+        """Returns values of one block pre-aggregated from the rows or from the lower blocks."""
+        if self.kind == "sum":
+            return exact_terms(values)
+        return [ METHODS[self.kind](values) ]
+
+    def blocks(self, level):
+        """Returns number of the blocks of the level."""
+        return len(self.levels[level]) // self.width
+
+    def extend(self, values):
+        """Adds blocks of the rows appended since the index was built."""
+        if len(values) < self.rows:
+            self.levels = [ array('d') ]
+        size = 1 << INDEX_LEAF
+        width = self.width
+        for block in range(self.blocks(0), len(values) // size):
+            self.levels[0].extend(self.block(values[block * size:(block + 1) * size]))
+        level = 0
+        while self.blocks(level) >= 2:
+            if level + 1 == len(self.levels):
+                self.levels.append(array('d'))
+            lower, upper = self.levels[level], self.levels[level + 1]
+            for block in range(self.blocks(level + 1), self.blocks(level) // 2):
+                upper.extend(self.block(lower[2 * block * width:(2 * block + 2) * width]))
+            level += 1
+        self.rows = len(values)
+
+    def cover(self, values, start, stop, shift):
+        """Returns partial results of the rows 'start' to 'stop' (excluded) of 'values' - blocks of the index and the remaining rows.
+
+        Rows of 'values' are rows of the indexed series shifted by 'shift'.
+        """
+        parts = []
+        row = start + shift
+        stop += shift
+        size = 1 << INDEX_LEAF
+        width = self.width
+        while row < stop:
+            if row % size:
+                "Rows before the start of the next block."
+                end = min(stop, row - row % size + size)
+                parts.extend(values[row - shift:end - shift])
+                row = end
+                continue
+            "The largest block starting at the row that fits into the rest."
+            level = len(self.levels) - 1
+            while level >= 0 and (row % (size << level) or row + (size << level) > stop or row // (size << level) >= self.blocks(level)
+                                  or math.isnan(self.levels[level][row // (size << level) * width])):
+                level -= 1
+            if level < 0:
+                end = min(stop, row + size)
+                parts.extend(values[row - shift:end - shift])
+                row = end
+                continue
+            block = row // (size << level)
+            parts.extend(self.levels[level][block * width:(block + 1) * width])
+            row += size << level
+        return parts
 
 def soft_error(message, req_lvl = 1, verbose_lvl = 1, ignore_error = True):
     """Prints error message to the stderr and if errors are not ignored it kills script executing."""
@@ -43,6 +359,33 @@ def is_number(val):
   except ValueError:
     return False
 
+def exact_sum(values):
+    """Returns correctly rounded sum of the values. It does not depend on the order of the values (see 'SeriesIndex')."""
+    try:
+        return math.fsum(values)
+    except (ValueError, OverflowError):
+        "Infinities of both signs or too big partial sums."
+        return sum(values)
+
+def exact_terms(values):
+    """Returns INDEX_TERMS values with the same exact sum as the given values. Returns NaNs if it needs more of them."""
+    rest = list(values)
+    terms = []
+    try:
+        for term in range(INDEX_TERMS):
+            terms.append(math.fsum(rest))
+            rest.append(-terms[-1])
+        if math.fsum(rest) == 0:
+            return terms
+    except (ValueError, OverflowError):
+        pass
+    return [ float("nan") ] * INDEX_TERMS
+
+def median(values):
+    """Returns median of the values. Module 'statistics' is imported only when the method is used."""
+    import statistics
+    return statistics.median(values)
+
 def pattern_time_format(val):
     """Retunrs patterns of the time format."""
     pattern = re.sub('[^%YymdHMS]', '.', val)
@@ -104,35 +447,25 @@ def check_min(settings, constants):
 def check_max_time(settings, constants):
     """Checks maximum time value and converts it to the seconds."""
     if settings["max_time"] not in [ "max" ]:
-        pattern = pattern_time_format(settings["time_format"])
-        if not re.compile("^" + pattern + "$").match(settings["max_time"]):
+        res, seconds = get_time_parser(settings["time_format"])(settings["max_time"])
+        if res or seconds is None:
             soft_error("WARNING: 'max_time' has an invalid value.", settings["verbose"], 1, settings["ignore_error"])
             verbose(" - Using default value.", settings["verbose"], 1)
             settings["max_time"] = constants["max_time"]
         else:
-            try:
-                settings["max_time"] = int(datetime.strptime(settings["max_time"], settings["time_format"]).strftime('%s')) + int(datetime.today().strftime('%s')) - int(datetime.utcnow().strftime('%s'))
-            except ValueError:
-                soft_error("WARNING: 'max_time' has an invalid value.", settings["verbose"], 1, settings["ignore_error"])
-                verbose(" - Using default value.", settings["verbose"], 1)
-                settings["max_time"] = constants["max_time"]
+            settings["max_time"] = seconds
     return settings["max_time"]
 
 def check_min_time(settings, constants):
     """Checks minimum time value and converts it to the seconds."""
     if settings["min_time"] not in [ "min" ]:
-        pattern = pattern_time_format(settings["time_format"])
-        if not re.compile("^" + pattern + "$").match(settings["min_time"]):
+        res, seconds = get_time_parser(settings["time_format"])(settings["min_time"])
+        if res or seconds is None:
             soft_error("WARNING: 'min_time' has an invalid value.", settings["verbose"], 1, settings["ignore_error"])
             verbose(" - Using default value.", settings["verbose"], 1)
             settings["min_time"] = constants["min_time"]
         else:
-            try:
-                settings["min_time"] = int(datetime.strptime(settings["min_time"], settings["time_format"]).strftime('%s')) + int(datetime.today().strftime('%s')) - int(datetime.utcnow().strftime('%s'))
-            except ValueError:
-                soft_error("WARNING: 'min_time' has an invalid value.", settings["verbose"], 1, settings["ignore_error"])
-                verbose(" - Using default value.", settings["verbose"], 1)
-                settings["min_time"] = constants["min_time"]
+            settings["min_time"] = seconds
     return settings["min_time"]
 
 def check_time(settings, constants):
@@ -164,6 +497,86 @@ def check_fps(settings, constants):
         settings["fps"] = constants["fps"]
     return settings["fps"]
 
+def check_jobs(settings, constants):
+    """Checks number of parallel gnuplot processes."""
+    if not str(settings["jobs"]).isdigit() or int(settings["jobs"]) < 1:
+        soft_error("WARNING: 'jobs' has to be an integer bigger than 0.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["jobs"]
+    return int(settings["jobs"])
+
+def check_stream(settings, constants):
+    """Checks how the frames are passed to ffmpeg."""
+    if settings["stream"] not in [ "auto", "pipe", "files" ]:
+        soft_error("WARNING: 'stream' has to be set to 'auto', 'pipe' or 'files'.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["stream"]
+    return settings["stream"]
+
+def check_frames(settings):
+    """Checks range of the rendered frames 'A:B' (B can be omitted - up to the last frame). Returns pair of the numbers or None for all frames."""
+    match = re.match(r"^([0-9]+):([0-9]*)$", settings["frames"])
+    if not match or int(match.group(1)) < 1 or match.group(2) and int(match.group(2)) < int(match.group(1)):
+        soft_error("WARNING: 'frames' has to be in format 'A:B' where 0 < A <= B.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Rendering all frames.", settings["verbose"], 1)
+        return None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+def check_preview(settings):
+    """Checks how many frames the preview skips. Returns None if the preview should not be rendered."""
+    if not str(settings["preview"]).isdigit() or int(settings["preview"]) < 1:
+        soft_error("WARNING: 'preview' has to be an integer bigger than 0.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Rendering the full video.", settings["verbose"], 1)
+        return None
+    return int(settings["preview"])
+
+def check_renderer(settings, constants):
+    """Checks which renderer draws the frames."""
+    if settings["renderer"] not in [ "gnuplot", "raster" ]:
+        soft_error("WARNING: 'renderer' has to be set to 'gnuplot' or 'raster'.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["renderer"]
+    return settings["renderer"]
+
+def check_cache_size(settings, constants):
+    """Checks size limit of the persistent cache."""
+    if not is_number(settings["cache_size"]) or float(settings["cache_size"]) < 0:
+        soft_error("WARNING: 'cache_size' has to be a positive number.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["cache_size"]
+    return float(settings["cache_size"])
+
+def check_follow(settings, constants):
+    """Checks how often the followed input files are checked for new data (in seconds)."""
+    if not is_number(settings["follow"]) or float(settings["follow"]) <= 0:
+        soft_error("WARNING: 'follow' has to be a positive number of seconds.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["follow_interval"]
+    return float(settings["follow"])
+
+def check_output_dir(settings, constants):
+    """Checks if the output directory exists."""
+    if not os.path.isdir(settings["output_dir"]):
+        soft_error("WARNING: output directory '{}' does not exist.".format(settings["output_dir"]), settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["output_dir"]
+    return settings["output_dir"]
+
+def check_daemon(settings):
+    """Checks address of the daemon in format "[host:]port". Returns tuple (host, port)."""
+    host, separator, port = str(settings["daemon"]).rpartition(":")
+    if not port.isdigit() or int(port) > 65535:
+        error("ERROR: address of the daemon has to be in format '[host:]port'.")
+    return (host or "127.0.0.1", int(port))
+
+def check_workers(settings, constants):
+    """Checks number of jobs rendered by the daemon at the same time."""
+    if not str(settings["workers"]).isdigit() or int(settings["workers"]) < 1:
+        soft_error("WARNING: 'workers' has to be an integer bigger than 0.", settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - Using default value.", settings["verbose"], 1)
+        return constants["workers"]
+    return int(settings["workers"])
+
 def check_legend(val):
     """Checks if legend is not an empty string."""
     if val.strip() == "":
@@ -226,8 +639,8 @@ def check_effect(settings, constants):
                         settings["colors"] = []
                     settings["colors"].append(c)
         elif directive == "method":
-            if value not in [ "average", "top" ]:
-                soft_error("WARNING: wrong effect parameter: method has to be set to 'average' or 'top'.", settings["verbose"], 1, settings["ignore_error"])
+            if value not in METHODS:
+                soft_error("WARNING: wrong effect parameter: method has to be set to one of: {}.".format(", ".join(sorted(METHODS))), settings["verbose"], 1, settings["ignore_error"])
                 verbose(" - Using default value.", settings["verbose"], 1)
                 settings["method"] = constants["method"]
             else:
@@ -268,71 +681,693 @@ def check_file(val):
     else:
         return check_pathname(val)
 
-def check_data_line(time, value, time_format):
-    """Checks input data values (time and value)."""
-    pattern = pattern_time_format(time_format)
-    if not re.compile("^" + pattern + "$").match(time):
-        return 1
-    elif not is_number(value):
-        return 2
-    return 0
-
-def select_drawable_data(data, distance, settings):
-    """Selects data that should be shown in the graph. Depends on te selected method it can compute the value."""
-    res_output = ""
-    col_num = 1
-    counter = 0
-    height = 0
-    ymax = None
-    ymin = None
-    start = None
-    for index_line, i_line in enumerate(data.split("\n")):
-        time, value = i_line.split()
-        time = int(time)
-        value = float(value)
-        if index_line == 0:
-            start = time
-        counter += 1
-
-        if (start + col_num * distance) > time or start == time:
-            if settings["method"] == "average":
-                height += value
-            else:
-                height = value if math.fabs(value) > math.fabs(height) else height
-
-            if col_num == 1:
-                ymax = height
-                ymin = height
+def utc_offset():
+    """Returns difference between the local time and UTC in seconds."""
+    return int(datetime.today().strftime('%s')) - int(datetime.utcnow().strftime('%s'))
+
+def strict_time_pattern(time_format):
+    """Returns exact pattern of the time format and names of its fields. Returns None if the format contains other options than '%YymdHMS'."""
+    pattern = ""
+    fields = []
+    index = 0
+    while index < len(time_format):
+        if time_format[index] == "%":
+            option = time_format[index+1:index+2]
+            "An empty string is in 'TIME_FIELDS' too - the format must not end with a bare '%'."
+            if not option or option not in TIME_FIELDS:
+                return None, None
+            pattern += "([0-9]{4})" if option == "Y" else "([0-9]{2})"
+            fields.append(option)
+            index += 2
+        else:
+            pattern += re.escape(time_format[index])
+            index += 1
+    return re.compile(pattern + "$"), fields
+
+def compile_time_parser(time_format):
+    """Compiles parser of the timestamps in the given format.
+
+    The parser returns a pair - 1 if the timestamp does not match the time format (0 otherwise) and
+    the time in seconds (None for invalid dates). Timestamps that exactly match a format made of
+    '%YymdHMS' options are converted without 'strptime', local time of each hour is computed only once.
+    """
+    loose = re.compile("^" + pattern_time_format(time_format) + "$")
+    strict, fields = strict_time_pattern(time_format)
+    offset = utc_offset()
+    hours = {}
+
+    def slow(time):
+        res = 0 if loose.match(time) else 1
+        try:
+            return res, int(datetime.strptime(time, time_format).strftime('%s')) + offset
+        except ValueError:
+            return res, None
+
+    if not strict:
+        return slow
+
+    "Default values are the same as the 'strptime' ones."
+    positions = dict((field, index) for index, field in enumerate(fields))
+    defaults = { "Y": 1900, "m": 1, "d": 1, "H": 0, "M": 0, "S": 0 }
+
+    def getter(field):
+        if field == "Y" and "y" in positions:
+            index = positions["y"]
+            return lambda groups: int(groups[index]) + (1900 if int(groups[index]) >= 69 else 2000)
+        if field not in positions:
+            value = defaults[field]
+            return lambda groups: value
+        index = positions[field]
+        return lambda groups: int(groups[index])
+
+    year, month, day, hour, minute, second = [ getter(field) for field in "YmdHMS" ]
+
+    def parse(time):
+        match = strict.match(time)
+        if not match:
+            return slow(time)
+        groups = match.groups()
+        minutes = minute(groups)
+        seconds = second(groups)
+        if minutes > 59 or seconds > 59:
+            return slow(time)
+        key = (year(groups), month(groups), day(groups), hour(groups))
+        base = hours.get(key)
+        if base is None:
+            try:
+                base = int(datetime(*key).strftime('%s')) + offset
+            except ValueError:
+                return slow(time)
+            hours[key] = base
+        return 0, base + minutes * 60 + seconds
+
+    return parse
+
+def get_time_parser(time_format):
+    """Returns parser of the timestamps in the given format. Each format is compiled only once."""
+    if time_format not in TIME_PARSERS:
+        TIME_PARSERS[time_format] = compile_time_parser(time_format)
+    return TIME_PARSERS[time_format]
+
+def parse_lines(lines, first_line, parse, settings, series, prev):
+    """Checks one chunk of input lines and appends suitable rows to the series.
+
+    Returns time of the last suitable row and list of problems found (line number and message).
+    """
+    problems = []
+    min_time = None if settings["min_time"] in [ "min" ] else settings["min_time"]
+    max_time = None if settings["max_time"] in [ "max" ] else settings["max_time"]
+    for index_line, line in enumerate(lines, first_line + 1):
+        if line == "":
+            continue
+        delim = line.rfind(" ")
+        time = line[:delim].strip()
+        value = line[delim+1:]
+
+        res, seconds = parse(time)
+        try:
+            value = float(value)
+            number = True
+        except ValueError:
+            number = False
+        if res:
+            problems.append((index_line, "wrong time format."))
+        elif not number:
+            problems.append((index_line, "wrong value."))
+
+        "Checks another mistakes in date (month # 13 etc.)"
+        if seconds is None:
+            problems.append((index_line, "wrong date."))
+            continue
+        if not number:
             continue
 
-        if settings["method"] == "average":
-            height = height / (counter-1)
+        "Skip if the time is out of desired range."
+        if min_time is not None and seconds < min_time:
+            continue
+        elif max_time is not None and seconds > max_time:
+            continue
 
-        if col_num == 1:
-            ymax = height
-            ymin = height
+        "If not first row in the file we have to check the order."
+        if prev is not None and seconds - prev <= 0:
+            problems.append((index_line, ORDER_PROBLEM))
+            continue
+        series.append(seconds, value)
+        prev = seconds
+    return prev, problems
+
+def validate_data(file_name, chunks, settings):
+    """Checks data from the input file - if the time is in correct format, order and if the values are numeric.
+
+    Lines are processed in chunks as they are read. Returns series of suitable rows or None if there are no suitable data.
+    """
+    parse = get_time_parser(settings["time_format"])
+    series = Series()
+    prev = None
+    first_line = 0
+    for lines in chunks:
+        with PROFILE.stage("validate_data"):
+            prev, problems = parse_lines(lines, first_line, parse, settings, series, prev)
+        first_line += len(lines)
+        report_problems(file_name, problems, 0, settings)
+    PROFILE.count("rows_read", first_line)
+    return suitable_series(file_name, series, settings)
+
+def report_problems(file_name, problems, first_line, settings):
+    """Reports problems found in the input file, line numbers are shifted by 'first_line'."""
+    for index_line, message in problems:
+        PROFILE.count("rows_rejected: " + message.rstrip("."))
+        soft_error("WARNING: file '{}':\n - line #{}: {}".format(file_name, first_line + index_line, message), settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - skipping", settings["verbose"], 1)
+
+def suitable_series(file_name, series, settings):
+    """Returns the series or None if there are no suitable data in the input file."""
+    PROFILE.count("rows_accepted", len(series))
+    if not len(series):
+        soft_error("WARNING: file '{}':\n - no suitable data found.".format(file_name), settings["verbose"], 1, settings["ignore_error"])
+        return None
+    return series
+
+def validate_inputs(settings):
+    """Loads and validates all input files. Yields name of the file and its suitable rows (see 'validate_data').
+
+    If more jobs are allowed local files are parsed by a pool of processes, large files in several byte ranges at once.
+    Parsed local files are kept in the series cache, later runs parse only the lines appended since then.
+    Local files that are not cached yet are read only within the time range, it is found by binary search.
+    Problems are still reported in the order of the files and lines.
+    """
+    options = { key: settings[key] for key in [ "time_format", "min_time", "max_time" ] }
+    "The series cache keeps files parsed without the time range, so the same entry serves any range."
+    unlimited = dict(options, min_time = "min", max_time = "max")
+    series_dir = cache_directory(settings, "series")
+    with contextlib.ExitStack() as stack:
+        downloads = start_downloads(settings, stack.enter_context(ThreadPoolExecutor(max_workers = DOWNLOAD_THREADS)))
+        executor = None
+        if settings["jobs"] > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers = settings["jobs"]))
+
+        "All parsing is started before waiting for the first file."
+        tasks = []
+        for file_name in settings["input"][0]:
+            if file_name in downloads:
+                continue
+            size = os.path.getsize(file_name)
+            if size == 0:
+                continue
+            entry = None
+            if series_dir:
+                path = os.path.join(series_dir, content_key(os.path.abspath(file_name), settings["time_format"], os.environ.get("TZ"), utc_offset()))
+                entry = read_input_entry(path, file_name)
+            if entry and (entry["offset"] or options == unlimited):
+                end = lines_end(file_name, size)
+                tasks.append((file_name, path, entry, 0, end, submit_ranges(executor, file_name, entry["offset"], end, unlimited)))
+            else:
+                "Reading only the time range is cheaper than caching the whole file, the cache is filled by a run without the range."
+                start, end = time_range_bytes(file_name, size, options) if options != unlimited else (0, size)
+                PROFILE.count("bytes_skipped", size - (end - start))
+                tasks.append((file_name, None, None, start, end, submit_ranges(executor, file_name, start, end, options)))
+
+        for file_name, path, entry, start, end, ranges in tasks:
+            verbose("Opening file '{}'".format(file_name), settings["verbose"], 2)
+            with PROFILE.stage("validate_data"):
+                if path:
+                    series, problems, count = cached_input(file_name, path, entry, end, ranges, options, unlimited)
+                else:
+                    series, problems, count = join_ranges(file_name, ranges, options)
+            PROFILE.count("rows_read", count)
+            "Lines before the range are counted only if there is a problem to report."
+            report_problems(file_name, problems, count_lines(file_name, start) if problems and start else 0, settings)
+            yield file_name, suitable_series(file_name, series, settings)
+
+        for file_name, chunks in load_downloads(settings, downloads):
+            yield file_name, validate_data(file_name, chunks, settings)
+
+def lines_end(file_name, size):
+    """Returns offset of the end of the last complete line (ended by a newline) of the file."""
+    with open(file_name, mode='rb') as i_file, mmap.mmap(i_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        return mapped.rfind(b"\n", 0, size) + 1
+
+def time_range_bytes(file_name, size, options):
+    """Finds the lines of the ordered input file within the time range of the options by binary search over the bytes.
+
+    Returns offset of the first line not before 'min_time' and offset of the first line after 'max_time'.
+    """
+    parse = get_time_parser(options["time_format"])
+    with open(file_name, mode='rb') as i_file, mmap.mmap(i_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        start = 0 if options["min_time"] in [ "min" ] else seek_time(mapped, 0, size, options["min_time"], parse, True)
+        end = size if options["max_time"] in [ "max" ] else seek_time(mapped, start, size, options["max_time"], parse, False)
+    return start, end
+
+def seek_time(buffer, start, end, seconds, parse, inclusive):
+    """Returns offset of the first line between 'start' and 'end' with time after 'seconds' (or equal to it if 'inclusive').
+
+    Lines without a valid time are skipped, they do not tell where the time is.
+    """
+    after = (lambda time: time >= seconds) if inclusive else (lambda time: time > seconds)
+    lo = start
+    hi = end
+    while hi - lo > SEEK_BYTES:
+        middle = buffer.find(b"\n", (lo + hi) // 2, hi) + 1
+        if middle == 0 or middle >= hi:
+            break
+        line, time, line_end = next_time(buffer, middle, hi, parse)
+        if time is None or after(time):
+            hi = middle
         else:
-            ymax = height if height > ymax else ymax
-            ymin = height if height < ymin else ymin
-
-        tmp = start + distance * col_num - distance / 2
-        res_output += "{} {}\n".format(tmp, height)
+            lo = line_end
+
+    "The rest is scanned line by line."
+    while lo < hi:
+        line, time, line_end = next_time(buffer, lo, hi, parse)
+        if time is None or after(time):
+            return line
+        lo = line_end
+    return hi
+
+def next_time(buffer, start, end, parse):
+    """Returns offset, time and end of the first line from 'start' on with a valid time. Returns (end, None, end) if there is none."""
+    while start < end:
+        line_end = buffer.find(b"\n", start, end) + 1 or end
+        line = buffer[start:line_end].decode("utf-8", "replace").strip()
+        seconds = parse(line[:line.rfind(" ")].strip())[1]
+        if seconds is not None:
+            return start, seconds, line_end
+        start = line_end
+    return end, None, end
+
+def count_lines(file_name, offset):
+    """Returns number of the lines of the file before the offset."""
+    count = 0
+    with open(file_name, mode='rb') as i_file, mmap.mmap(i_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        for start in range(0, offset, CHUNK_BYTES):
+            count += mapped[start:min(offset, start + CHUNK_BYTES)].count(b"\n")
+    return count
+
+def split_ranges(file_name, start, end):
+    """Splits part of the file into byte ranges of whole lines. Returns list of the ranges (start, end)."""
+    if start >= end:
+        return []
+    bounds = [ start ]
+    with open(file_name, mode='rb') as i_file, mmap.mmap(i_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        while bounds[-1] + RANGE_BYTES < end:
+            split = mapped.find(b"\n", bounds[-1] + RANGE_BYTES - 1, end)
+            if split == -1 or split + 1 == end:
+                break
+            bounds.append(split + 1)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def submit_ranges(executor, file_name, start, end, options):
+    """Starts parsing part of the file by the worker processes. Without executor the part is parsed later by 'join_ranges'.
+
+    Returns list of the ranges with futures of their results.
+    """
+    if not executor:
+        return [ (start, end, None) ] if start < end else []
+    return [ (range_start, range_end, executor.submit(parse_range, file_name, range_start, range_end, options)) for range_start, range_end in split_ranges(file_name, start, end) ]
+
+def parse_range(file_name, start, end, options, prev = None):
+    """Parses the byte range of the input file, runs in a worker process.
+
+    Returns suitable rows, problems with line numbers counted from the start of the range and number of the lines.
+    """
+    parse = get_time_parser(options["time_format"])
+    series = Series()
+    problems = []
+    count = 0
+    with open(file_name, mode='rb') as i_file, mmap.mmap(i_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        for lines in read_chunks(mapped, start, end):
+            prev, chunk_problems = parse_lines(lines, count, parse, options, series, prev)
+            problems.extend(chunk_problems)
+            count += len(lines)
+    return series, problems, count
+
+def join_ranges(file_name, ranges, options, prev = None):
+    """Joins results of the parsed byte ranges of one file. Returns suitable rows, problems and number of the lines.
+
+    A range is parsed without knowing the last row of the previous one. If its first row is not later than that row,
+    the range is parsed again here so the order is checked the same way as in one pass.
+    """
+    series = Series()
+    problems = []
+    count = 0
+    for start, end, future in ranges:
+        last = series.times[-1] if len(series) else prev
+        if future:
+            part, part_problems, part_count = future.result()
+        if not future or last is not None and len(part) and part.times[0] <= last:
+            part, part_problems, part_count = parse_range(file_name, start, end, options, last)
+        problems.extend([ (count + index_line, message) for index_line, message in part_problems ])
+        series.extend(part)
+        count += part_count
+    return series, problems, count
+
+def cached_input(file_name, path, entry, end, ranges, options, unlimited):
+    """Completes the cached entry of the input file by the newly parsed lines and saves it. Returns suitable rows, problems and number of the lines.
+
+    The last line without a newline may still grow, it is parsed on every run and never cached.
+    """
+    if ranges:
+        prev = entry["series"].times[-1] if len(entry["series"]) else None
+        series, problems, count = join_ranges(file_name, ranges, unlimited, prev)
+        entry["series"].extend(series)
+        entry["problems"].extend([ (entry["lines"] + index_line, message) for index_line, message in problems ])
+        entry["lines"] += count
+        entry["offset"] = end
+    stat = os.stat(file_name)
+    if not entry.get("id"):
+        "Indexes of the series are valid only for the entry with the same id."
+        entry["id"] = hashlib.sha256(os.urandom(16)).hexdigest()[:16]
+        entry["size"] = None
+    if (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        entry["size"] = stat.st_size
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entry["fingerprint"] = input_fingerprint(file_name, entry["offset"])
+        try:
+            write_input_entry(path, entry)
+        except OSError:
+            pass
+    else:
+        PROFILE.count("series_cache_hits")
+
+    source = { "path": path, "id": entry["id"], "series": entry["series"], "indexes": {} }
+    series = Series(indexed = [ (0, len(entry["series"]), 0, source) ])
+    series.extend(entry["series"])
+    problems = list(entry["problems"])
+    prev = series.times[-1] if len(series) else None
+    tail, tail_problems, count = join_ranges(file_name, [ (end, stat.st_size, None) ], unlimited, prev)
+    series.extend(tail)
+    problems.extend([ (entry["lines"] + index_line, message) for index_line, message in tail_problems ])
+    count += entry["lines"]
+
+    if options == unlimited:
+        return series, problems, count
+    "Only the lines a run without the cache reads are reported, so the cache does not change the warnings."
+    range_start, range_end = time_range_bytes(file_name, stat.st_size, options)
+    if any([ message == ORDER_PROBLEM for index_line, message in problems ]):
+        series, problems, count = join_ranges(file_name, [ (range_start, range_end, None) ], options)
+        first_line = count_lines(file_name, range_start) if problems and range_start else 0
+        return series, [ (first_line + index_line, message) for index_line, message in problems ], count
+    if problems:
+        first_line = count_lines(file_name, range_start) if range_start else 0
+        "The last line is in the range if the range ends in the middle of it (the file does not end by a newline)."
+        last_line = count_lines(file_name, range_end) + (0 if lines_end(file_name, range_end) == range_end else 1)
+        problems = [ (index_line, message) for index_line, message in problems if first_line < index_line <= last_line ]
+    "Rows of a file in order are in order in any time range too - the range is just a slice of them."
+    start = 0 if options["min_time"] in [ "min" ] else bisect.bisect_left(series.times, options["min_time"])
+    stop = len(series) if options["max_time"] in [ "max" ] else bisect.bisect_right(series.times, options["max_time"])
+    return series.window(start, stop), problems, count
+
+def read_appended(file_name, tail, prev, options, settings):
+    """Parses lines appended to the followed file since the last call. Returns their suitable rows.
+
+    'tail' keeps the offset and the number of the lines parsed so far. The last line is parsed once its newline is written.
+    """
+    if tail["offset"] is None:
+        return Series()
+    try:
+        size = os.path.getsize(file_name)
+    except OSError:
+        return Series()
+    if size < tail["offset"]:
+        soft_error("WARNING: file '{}' was truncated.".format(file_name), settings["verbose"], 1, settings["ignore_error"])
+        verbose(" - It is not followed any more.", settings["verbose"], 1)
+        tail["offset"] = None
+        return Series()
+    end = lines_end(file_name, size) if size > tail["offset"] else size
+    if end <= tail["offset"]:
+        return Series()
+    series, problems, count = parse_range(file_name, tail["offset"], end, options, prev)
+    report_problems(file_name, problems, tail["lines"], settings)
+    PROFILE.count("rows_read", count)
+    tail["offset"] = end
+    tail["lines"] += count
+    return series
+
+def input_fingerprint(file_name, offset):
+    """Returns hash of the first 'offset' bytes of the file."""
+    digest = hashlib.sha256()
+    with open(file_name, mode='rb') as i_file:
+        while offset > 0:
+            block = i_file.read(min(offset, FINGERPRINT_BYTES))
+            if not block:
+                break
+            digest.update(block)
+            offset -= len(block)
+    return digest.hexdigest()
+
+def series_index(source, kind):
+    """Returns index of the given kind of the cached series. It is loaded from the series cache and extended by the appended rows or built."""
+    if kind not in source["indexes"]:
+        path = "{}.{}.index".format(source["path"], kind)
+        index = read_index(path, source["id"], kind) or SeriesIndex(kind)
+        rows = index.rows
+        if rows != len(source["series"]):
+            with PROFILE.stage("build_index"):
+                index.extend(source["series"].values)
+            try:
+                write_index(path, source["id"], index)
+            except OSError:
+                pass
+        source["indexes"][kind] = index
+    return source["indexes"][kind]
+
+def write_index(path, entry_id, index):
+    """Saves the index to the binary file - header, sizes of the levels and the levels."""
+    header = struct.pack(INDEX_HEADER, INDEX_MAGIC, entry_id.encode(), index.rows, len(index.levels))
+    sizes = array('q', [ len(level) for level in index.levels ])
+    write_file(path, header + sizes.tobytes() + b"".join([ level.tobytes() for level in index.levels ]))
+
+def read_index(path, entry_id, kind):
+    """Loads index saved by 'write_index'. Returns None if the file is missing, damaged or belongs to another entry."""
+    try:
+        with open(path, "rb") as index_file:
+            content = index_file.read()
+        magic, index_id, rows, count = struct.unpack_from(INDEX_HEADER, content)
+        if magic != INDEX_MAGIC or index_id != entry_id.encode():
+            return None
+        start = struct.calcsize(INDEX_HEADER)
+        sizes = array('q')
+        sizes.frombytes(content[start:start + count * sizes.itemsize])
+        start += count * sizes.itemsize
+        levels = []
+        for size in sizes:
+            levels.append(array('d'))
+            levels[-1].frombytes(content[start:start + size * levels[-1].itemsize])
+            start += size * levels[-1].itemsize
+    except (OSError, struct.error, ValueError):
+        return None
+    index = SeriesIndex(kind, rows, levels)
+    if len(levels) != count or not levels or any([ len(level) != size or size % index.width for level, size in zip(levels, sizes) ]):
+        return None
+    os.utime(path, None)
+    return index
 
-        height = value
-        counter = 1
+def read_input_entry(path, file_name):
+    """Loads the cached entry of the input file. Returns an empty entry if there is none or the file changed other way than by appending."""
+    entry = { "id": None, "size": 0, "mtime_ns": 0, "offset": 0, "lines": 0, "fingerprint": None, "problems": [], "series": Series() }
+    meta = warm_input(path)
+    try:
+        if meta is None:
+            with open(path + ".json", "r", encoding = "utf-8") as meta_file:
+                meta = json.load(meta_file)
+        stat = os.stat(file_name)
+    except (OSError, ValueError):
+        return entry
+    if stat.st_size < meta["offset"]:
+        return entry
+    if (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        "Changed file keeps its entry only if it grew and the whole cached part of it stayed the same."
+        if stat.st_size <= meta["size"] or meta["fingerprint"] != input_fingerprint(file_name, meta["offset"]):
+            return entry
+    if "series" not in meta:
+        series = read_series(path)
+        if series is None or len(series) != meta["rows"]:
+            return entry
+        meta["series"] = series
+        meta["problems"] = [ tuple(problem) for problem in meta["problems"] ]
+        keep_input_warm(path, meta)
+    try:
+        os.utime(path + ".json", None)
+    except OSError:
+        pass
+    return meta
+
+def write_input_entry(path, entry):
+    """Saves the cached entry of the input file - the series and the description of the parsed part of the file."""
+    write_series(path, entry["series"])
+    meta = dict(entry, rows = len(entry["series"]))
+    del meta["series"]
+    write_file(path + ".json", json.dumps(meta).encode())
+    keep_input_warm(path, dict(meta, series = entry["series"]))
+
+def keep_inputs_warm(limit):
+    """Keeps recently used entries of the series cache in memory, so a long-running process does not load them again.
+
+    Least recently used entries are dropped once their series take more than 'limit' bytes.
+    """
+    global WARM_INPUTS, WARM_INPUTS_LIMIT, WARM_INPUTS_SIZE
+    WARM_INPUTS = collections.OrderedDict()
+    WARM_INPUTS_LIMIT = limit
+    WARM_INPUTS_SIZE = 0
+
+def input_entry_size(entry):
+    """Returns number of bytes taken by the series of the cached entry."""
+    series = entry["series"]
+    return len(series) * (series.times.itemsize + series.values.itemsize)
+
+def copy_input_entry(entry):
+    """Returns copy of the cached entry that can be extended without changing the original."""
+    series = Series(array(entry["series"].times.typecode, entry["series"].times), array(entry["series"].values.typecode, entry["series"].values))
+    return dict(entry, series = series, problems = list(entry["problems"]))
+
+def warm_input(path):
+    """Returns copy of the entry of the series cache kept in memory or None."""
+    if WARM_INPUTS is None:
+        return None
+    with WARM_INPUTS_LOCK:
+        entry = WARM_INPUTS.get(path)
+        if entry is None:
+            return None
+        WARM_INPUTS.move_to_end(path)
+    return copy_input_entry(entry)
+
+def keep_input_warm(path, entry):
+    """Keeps copy of the entry of the series cache in memory if it is enabled and the entry fits into the limit."""
+    global WARM_INPUTS_SIZE
+    if WARM_INPUTS is None or input_entry_size(entry) > WARM_INPUTS_LIMIT:
+        return
+    entry = copy_input_entry(entry)
+    with WARM_INPUTS_LOCK:
+        if path in WARM_INPUTS:
+            WARM_INPUTS_SIZE -= input_entry_size(WARM_INPUTS.pop(path))
+        WARM_INPUTS[path] = entry
+        WARM_INPUTS_SIZE += input_entry_size(entry)
+        while WARM_INPUTS_SIZE > WARM_INPUTS_LIMIT:
+            WARM_INPUTS_SIZE -= input_entry_size(WARM_INPUTS.popitem(last = False)[1])
+
+def merge_data(suitable_data, settings):
+    """Orders series of the input files by their first time and merges them into one series if they do not overlap.
+
+    Returns list of the series that should be drawn.
+    """
+    with PROFILE.stage("merge_data"):
+        return join_data(suitable_data, settings)
+
+def join_data(suitable_data, settings):
+    """Merges series of the input files, see 'merge_data'."""
+    suitable_data = sorted(suitable_data, key = lambda i_data: i_data.times[0])
+
+    """Checks overlaping of the dates in all input files."""
+    for prev, i_data in zip(suitable_data, suitable_data[1:]):
+        if i_data.times[0] <= prev.times[-1]:
+            verbose("One curve for each input file in one graph will be generated.", settings["verbose"], 1)
+            return suitable_data
+
+    verbose("One curve for all input files in one graph will be generated.", settings["verbose"], 1)
+
+    """Files are ordered and not overlaping - merging them is just appending one after another."""
+    joined_data = Series()
+    for i_data in suitable_data:
+        joined_data.extend(i_data)
+    return [ joined_data ]
+
+def bucket_data(data, distance, settings):
+    """Splits rows into columns of width 'distance' and computes height of each column by the selected method.
+
+    Columns are found by binary search over the times, each column is then reduced at once. The last column
+    takes all remaining rows.
+    """
+    res_output = Series(array('d'))
+    if data.indexed and settings["method"] in INDEX_KINDS:
+        reduce = lambda lo, hi: reduce_indexed(data, lo, hi, settings["method"])
+    else:
+        reduce = lambda lo, hi: METHODS[settings["method"]](data.values[lo:hi])
+    times = data.times
+    start = times[0]
+    col_num = 1
+    lo = 0
+    while lo < len(times):
+        if distance > 0 and col_num < settings["columns"]:
+            hi = bisect.bisect_left(times, start + col_num * distance, lo)
+        else:
+            hi = len(times)
+        if hi > lo:
+            res_output.append(start + distance * col_num - distance / 2, reduce(lo, hi))
+        lo = hi
         col_num += 1
-
-        while start + col_num * distance < time:
+    return res_output
+
+def reduce_indexed(data, lo, hi, method):
+    """Computes height of the column of rows 'lo' to 'hi' (excluded) from the blocks of the indexes and the rows they do not cover."""
+    if method == "count":
+        return float(hi - lo)
+    if method == "last":
+        return data.values[hi - 1]
+    parts = []
+    row = lo
+    for start, stop, shift, source in data.indexed:
+        start = max(start, row)
+        stop = min(stop, hi)
+        if start >= stop:
+            continue
+        parts.extend(data.values[row:start])
+        parts.extend(series_index(source, INDEX_KINDS[method]).cover(data.values, start, stop, shift))
+        row = stop
+    parts.extend(data.values[row:hi])
+    if method == "average":
+        return exact_sum(parts) / (hi - lo)
+    return METHODS[method](parts)
+
+def close_buckets(data, origin, distance, settings):
+    """Splits rows into columns of width 'distance' counted from 'origin', the same way as 'bucket_data' without the limit of the columns.
+
+    Only columns followed by a later row are complete, the last one may still grow. Returns the complete columns
+    and number of the rows they took.
+    """
+    res_output = Series(array('d'))
+    reduce = METHODS[settings["method"]]
+    times = data.times
+    lo = 0
+    while lo < len(times):
+        col_num = math.floor((times[lo] - origin) / distance) + 1
+        while origin + col_num * distance <= times[lo]:
             col_num += 1
+        hi = bisect.bisect_left(times, origin + col_num * distance, lo)
+        if hi == len(times):
+            break
+        res_output.append(origin + distance * col_num - distance / 2, reduce(data.values[lo:hi]))
+        lo = hi
+    return res_output, lo
+
+def select_drawable_data(data, distance, settings):
+    """Selects data that should be shown in the graph. Depends on te selected method it can compute the value."""
+    with PROFILE.stage("select_drawable_data"):
+        "Indexed data are bucketed without reading all rows, hashing them for the buckets cache would cost more."
+        buckets_dir = None if data.indexed and settings["method"] in INDEX_KINDS else cache_directory(settings, "buckets")
+        if buckets_dir:
+            path = os.path.join(buckets_dir, content_key(data.times, data.values, distance, settings["columns"], settings["method"]))
+            res_output = read_series(path)
+            if res_output is None:
+                res_output = bucket_data(data, distance, settings)
+                try:
+                    write_series(path, res_output)
+                except OSError:
+                    pass
+            else:
+                PROFILE.count("bucket_cache_hits")
+        else:
+            res_output = bucket_data(data, distance, settings)
+    PROFILE.count("buckets", len(res_output))
 
-    "If the loop ended in the middle of the column last value was not added."
-    if start + col_num * distance < time or start == time:
-        if settings["method"] == "average":
-            height = height if counter == 1 else height / (counter-1)
-        ymax = height if height > ymax else ymax
-        ymin = height if height < ymin else ymin
-        tmp = start + distance * col_num - distance / 2
-        res_output += "{} {}".format(tmp, height)
+    ymax, ymin = value_range(res_output, settings)
+    return [res_output, ymax, ymin]
+
+def value_range(res_output, settings):
+    """Returns maximal and minimal value of the selected data, the values set by the user take precedence."""
+    ymax = max(res_output.values)
+    ymin = min(res_output.values)
 
     "Checks if the values are in the desired range."
     if settings["min_val"] not in [ "min" ]:
@@ -349,34 +1384,30 @@ def select_drawable_data(data, distance, settings):
         else:
             ymax = settings["max_val"]
 
-    return [res_output, ymax, ymin]
+    return ymax, ymin
 
 def count_frames(data, ymax, ymin, jump, delay):
     """Counts how many frames will take to each point to get to the position and returns the highest value."""
     frames = None
-    tmp_border = math.fabs(ymin) if math.fabs(ymin) > math.fabs(ymax) else math.fabs(ymax)
-    for index, line in enumerate(data.split("\n")):
-        if line == "":
-            continue
-        time, value = line.split()
-        value = float(value)
-
-        tmp_val = (tmp_border - math.fabs(value)) / jump
-        tmp_val += index * delay
-        if not frames or tmp_val > frames:
-            frames = tmp_val
+    with PROFILE.stage("count_frames"):
+        tmp_border = math.fabs(ymin) if math.fabs(ymin) > math.fabs(ymax) else math.fabs(ymax)
+        for index, value in enumerate(data.values):
+            tmp_val = (tmp_border - math.fabs(value)) / jump
+            tmp_val += index * delay
+            if not frames or tmp_val > frames:
+                frames = tmp_val
     return frames
 
 def get_max_date(data, prevMax):
     """Finds the maximal dates."""
-    if not prevMax or prevMax < int(data.split()[-2:-1][0]):
-        prevMax = int(data.split()[-2:-1][0])
+    if not prevMax or prevMax < data.times[-1]:
+        prevMax = data.times[-1]
     return prevMax
 
 def get_min_date(data, prevMin):
     """Finds the minimal dates."""
-    if not prevMin or prevMin > int(data.split()[0]):
-        prevMin = int(data.split()[0])
+    if not prevMin or prevMin > data.times[0]:
+        prevMin = data.times[0]
     return prevMin
 
 def set_speed_fps_if_needed(settings, frames):
@@ -387,6 +1418,14 @@ def set_speed_fps_if_needed(settings, frames):
         settings["fps"] = round(frames / (int(settings["speed"]) * int(settings["time"])), 2)
     return settings
 
+def pad_y_range(ymin, ymax, jump, settings):
+    """If the minimal and maximal values are not set 'ymax' and 'ymin' are adjusted to create a gap in the top and bottom of the graph."""
+    if settings["max_val"] == "max":
+        ymax = 0 if ymax <= 0 and ymax + 20 * jump > 0 else ymax + 20 * jump
+    if settings["min_val"] == "min":
+        ymin = 0 if ymin >= 0 and ymin - 20 * jump < 0 else ymin - 20 * jump
+    return ymin, ymax
+
 def set_y_range(min_val, max_val, ymin, ymax):
     """Sets range of the y axis"""
     yrange = ""
@@ -451,6 +1490,18 @@ def load_config(settings):
                 if settings["fps"]:
                     continue
                 settings["fps"] = float(value)
+            elif directive == "jobs":
+                if settings["jobs"]:
+                    continue
+                settings["jobs"] = value
+            elif directive == "stream":
+                if settings["stream"]:
+                    continue
+                settings["stream"] = value.lower()
+            elif directive == "renderer":
+                if settings["renderer"]:
+                    continue
+                settings["renderer"] = value.lower()
             elif directive == "legend":
                 if settings["legend"]:
                     continue
@@ -480,52 +1531,1039 @@ def load_config(settings):
 
     return settings
 
-def load_data_file(i_file):
-    """Loads input data file."""
-    data = []
-    for i, line in enumerate(i_file):
-        decodedLine = re.sub("\n", "", line.decode("utf-8"))
-        data.append(decodedLine.strip())
-    if len(data) == 0:
-        del data
+def read_chunks(buffer, start = 0, size = None):
+    """Splits the input data (or its part from 'start' to 'size') into chunks of whole lines. Yields lists of the lines.
+
+    Only one chunk is decoded at a time, so memory does not grow with the size of the input.
+    """
+    if size is None:
+        size = len(buffer)
+    while start < size:
+        with PROFILE.stage("read_chunks"):
+            end = buffer.find(b"\n", min(start + CHUNK_BYTES, size - 1), size)
+            end = size if end == -1 else end + 1
+            text = buffer[start:end].decode("utf-8")
+            if text.endswith("\n"):
+                text = text[:-1]
+            lines = [ line.strip() for line in text.split("\n") ]
+        yield lines
+        start = end
+
+def open_gnuplot(preamble, stdout = None):
+    """Starts one long-lived gnuplot session and sends it the settings shared by all frames."""
+    try:
+        gnuplot = subprocess.Popen(["gnuplot"], stdin=subprocess.PIPE, stdout=stdout)
+    except OSError:
+        error("'gnuplot' could not be started.")
+    write_gnuplot(gnuplot, preamble)
+    return gnuplot
+
+def write_gnuplot(gnuplot, script):
+    """Sends part of the script to the running gnuplot session."""
+    data = script.encode()
+    PROFILE.count("bytes_to_gnuplot", len(data))
+    try:
+        gnuplot.stdin.write(data)
+        gnuplot.stdin.flush()
+    except BrokenPipeError:
+        error("gnuplot terminated unexpectedly (exit code {}).".format(gnuplot.wait()))
+
+def close_gnuplot(gnuplot):
+    """Closes the gnuplot session and waits until all frames are written."""
+    try:
+        gnuplot.stdin.close()
+    except BrokenPipeError:
+        pass
+    with PROFILE.stage("gnuplot_wait"):
+        gnuplot.wait()
+    if gnuplot.returncode != 0:
+        error("gnuplot failed while generating frames (exit code {}).".format(gnuplot.returncode))
+
+def select_colors(count, settings, constants, seed):
+    """Selects different color for each curve. Colors are chosen randomly, the seed makes the choice repeatable."""
+    rng = random.Random(seed)
+    selected_colors = []
+    for index in range(count):
+        if "colors" not in settings:
+            tmp = constants["colors"][rng.randrange(len(constants["colors"]))]
+            while tmp in selected_colors:
+                tmp = constants["colors"][rng.randrange(len(constants["colors"]))]
+            selected_colors.append(tmp)
+        else:
+            tmp = settings["colors"][rng.randrange(len(settings["colors"]))]
+            while tmp in selected_colors:
+                if len(selected_colors) >= count:
+                    tmp = constants["colors"][rng.randrange(len(constants["colors"]))]
+                else:
+                    tmp = settings["colors"][rng.randrange(len(settings["colors"]))]
+            selected_colors.append(tmp)
+    return selected_colors
+
+def render_video(settings, constants, scene, frames, real_frames, digits, key):
+    """Renders all frames and generates the video. Frame sets are kept in the render cache under the given key.
+
+    Piped frames never reach the disk, so only frame sets rendered into files are stored (if they fit into the cache).
+    """
+    pipe = use_stream(settings, constants, real_frames)
+    frames_dir = cache_directory(settings, "frames")
+    if frames_dir:
+        cached = os.path.join(frames_dir, key)
+        if os.path.isdir(cached):
+            os.utime(cached, None)
+            print("All frames loaded from the cache.")
+            return generate_video(settings, digits, cached)
+
+    renderer = open_renderer(scene, settings, pipe)
+    if pipe:
+        return stream_video(settings, renderer, frames)
+
+    "Frames are rendered next to the cache entry and moved there once they are complete, interrupted renders remove them."
+    tmp_dir = tempfile.mkdtemp(prefix = ".", dir = frames_dir)
+    try:
+        render_frames(renderer, frames, tmp_dir, digits)
+        message = generate_video(settings, digits, tmp_dir)
+        if frames_dir and directory_size(tmp_dir) <= settings["cache_size"] * 1024 * 1024:
+            try:
+                os.rename(tmp_dir, cached)
+            except OSError:
+                pass
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+    return message
+
+def render_segment(settings, constants, scene, frames, first, last, real_frames, digits):
+    """Renders frames 'first' to 'last' into a lossless video segment, see 'stitch_video'.
+
+    All segments of the video are written to the same directory (see 'segments_directory'), a segment
+    rendered again replaces the previous one. Segments bypass the render cache, it keeps only complete frame sets.
+    """
+    pipe = use_stream(settings, constants, (last - first + 1) * int(settings["speed"]))
+    suffix = ".{0:0{2}d}-{1:0{2}d}.mkv".format(first, last, len(str(frame_total(real_frames, settings))))
+    video = os.path.join(segments_directory(settings), settings["name"] + suffix)
+    try:
+        os.remove(video)
+    except OSError:
+        pass
+    renderer = open_renderer(scene, settings, pipe)
+    if pipe:
+        return stream_video(settings, renderer, frames, segment = suffix, video = video)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        render_frames(renderer, frames, tmp_dir, digits)
+        return generate_video(settings, digits, tmp_dir, first, suffix, video = video)
+
+def segments_directory(settings):
+    """Returns directory of the video segments of the render - '<output dir>/<name>/segments'. It is created if it does not exist."""
+    directory = os.path.join(settings["output_dir"], settings["name"], SEGMENTS_DIR)
+    with TARGET_LOCK:
+        os.makedirs(directory, exist_ok = True)
+    return os.path.normpath(directory)
+
+def render_preview(settings, constants, scene, frames, real_frames, digits):
+    """Renders the preview - every N-th frame in the reduced size. Preview bypasses the render cache."""
+    pipe = use_stream(settings, constants, real_frames / settings["preview"])
+    renderer = open_renderer(scene, settings, pipe)
+    if pipe:
+        return stream_video(settings, renderer, frames)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        render_frames(renderer, frames, tmp_dir, digits)
+        return generate_video(settings, digits, tmp_dir)
+
+def render_live_segment(settings, constants, scene, frames, first, last, video):
+    """Renders frames 'first' to 'last' into the HLS segment (MPEG-TS) at the given path. Returns duration of the segment in seconds.
+
+    Timestamps of the segment continue where the previous segment ended.
+    """
+    pipe = use_stream(settings, constants, (last - first + 1) * int(settings["speed"]))
+    codec = [ "-c:v", "libx264", "-pix_fmt", "yuv420p", "-r", str(settings["fps"]), "-output_ts_offset", str((first - 1) / IMAGE_FPS), "-f", "mpegts" ]
+    renderer = open_renderer(scene, settings, pipe)
+    if pipe:
+        stream_video(settings, renderer, frames, segment = ".ts", codec = codec, video = video)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            digits = len(str(last))
+            render_frames(renderer, frames, tmp_dir, digits)
+            generate_video(settings, digits, tmp_dir, first, ".ts", codec, video)
+    return (last - first + 1) / IMAGE_FPS
+
+def write_playlist(path, segments, target_duration, finished = False):
+    """Writes HLS playlist of the segments (file name and duration). Until it is finished players keep reloading it."""
+    lines = [ "#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-PLAYLIST-TYPE:EVENT", "#EXT-X-TARGETDURATION:{}".format(int(math.ceil(target_duration))), "#EXT-X-MEDIA-SEQUENCE:0" ]
+    for name, duration in segments:
+        lines.append("#EXTINF:{:.3f},".format(duration))
+        lines.append(name)
+    if finished:
+        lines.append("#EXT-X-ENDLIST")
+    write_file(path, ("\n".join(lines) + "\n").encode())
+
+def segment_frames(segment):
+    """Returns range of the frames of the video segment from its name or None if the name is not in the format of 'render_segment'."""
+    match = re.search(r"\.([0-9]+)-([0-9]+)\.mkv$", segment)
+    if not match:
         return None
-    return data
+    return int(match.group(1)), int(match.group(2))
+
+def stitch_video(settings, segments):
+    """Joins video segments rendered with '--Frames' into the final video.
+
+    Segments are ordered by their frames and concatenated without decoding loss, then encoded the same way
+    as all frames of a single run.
+    """
+    ranges = [ segment_frames(segment) for segment in segments ]
+    if None in ranges:
+        error("'{}' is not a video segment rendered with '--Frames'.".format(segments[ranges.index(None)]))
+    ordered = sorted(zip(ranges, segments))
+    if ordered[0][0][0] != 1:
+        soft_error("WARNING: the first segment does not start with the frame #1.", settings["verbose"], 1, settings["ignore_error"])
+    for (prev, prev_segment), (frames, segment) in zip(ordered, ordered[1:]):
+        if frames[0] != prev[1] + 1:
+            error("segment '{}' does not follow '{}' (frames {}-{} after {}-{}).".format(segment, prev_segment, frames[0], frames[1], prev[0], prev[1]))
+
+    "Segments from the directory of the render are joined into the video next to it, replacing the previous one."
+    directories = set([ os.path.dirname(os.path.abspath(segment)) for frames, segment in ordered ])
+    if len(directories) == 1 and os.path.basename(list(directories)[0]) == SEGMENTS_DIR:
+        name = re.sub(r"\.[0-9]+-[0-9]+\.mkv$", ".mp4", os.path.basename(ordered[0][1]))
+        video = os.path.join(os.path.dirname(list(directories)[0]), name)
+    else:
+        video = create_target_directory(settings)
+
+    print("Generating video...")
+    with tempfile.NamedTemporaryFile("w", suffix = ".txt", encoding = "utf-8") as concat_file:
+        for frames, segment in ordered:
+            concat_file.write("file '{}'\n".format(os.path.abspath(segment).replace("'", "'\\''")))
+        concat_file.flush()
+        cmd = [ "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_file.name, "-r", str(settings["fps"]), video ]
+        try:
+            proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        except OSError:
+            error("'ffmpeg' could not be started.")
+        with PROFILE.stage("ffmpeg_wait"):
+            output = proc.communicate()[0].decode(errors = "replace")
+
+    verbose(output, settings["verbose"], 2)
+    if proc.returncode != 0:
+        error("ffmpeg failed while joining the segments (exit code {}).".format(proc.returncode))
 
-def generate_video(settings, digits, tmp_dir):
-    """Creates target directory and generates video (using ffmpeg)."""
+    return "Video generated: '{}'".format(video)
+
+def use_stream(settings, constants, real_frames):
+    """Decides if the frames are piped to ffmpeg or written to the temporary directory first."""
+    if settings["stream"] == "auto":
+        return real_frames / int(settings["speed"]) >= constants["stream_frames"]
+    return settings["stream"] == "pipe"
+
+def create_target_directory(settings, suffix = ".mp4"):
+    """Creates target directory for the video in the output directory and returns path of the video."""
+    with TARGET_LOCK:
+        return make_target_directory(settings, suffix)
+
+def make_target_directory(settings, suffix):
+    """Creates target directory for the video, see 'create_target_directory'."""
     index = 1
-    video_name = settings["name"] + '.mp4'
+    video_name = settings["name"] + suffix
     print("Creating target directory for the video.")
     
-    directories = [x[0] for x in os.walk('./')]
+    directories = [ os.path.join('./', os.path.relpath(x[0], settings["output_dir"])) for x in os.walk(settings["output_dir"]) ]
     tmp = None
     for directory in directories:
         if re.compile("^./" + settings["name"] + ".*$").match(directory):
             index = directory.rfind("_")
             if index == -1 or not directory[index+1:].isdigit():
-                tmp = 1
+                tmp = tmp or 1
             else:
-                if tmp < int(directory[index+1:]) + 1:
+                if not tmp or tmp < int(directory[index+1:]) + 1:
                     tmp = int(directory[index+1:]) + 1
 
     if tmp:
         settings["name"] = "{}_{}".format(settings["name"], tmp)
 
-    os.makedirs(settings["name"])
+    target = os.path.normpath(os.path.join(settings["output_dir"], settings["name"]))
+    os.makedirs(target)
+
+    return "{}/{}".format(target, video_name)
+
+def cache_directory(settings, kind):
+    """Returns directory of the given kind of the persistent cache. Returns None if the cache is disabled."""
+    if not settings["cache"]:
+        return None
+    directory = os.path.join(settings["cache_dir"], kind)
+    try:
+        os.makedirs(directory, exist_ok = True)
+    except OSError:
+        verbose("WARNING: cache directory '{}' could not be created.".format(directory), settings["verbose"], 1)
+        return None
+    return directory
+
+def content_key(*parts):
+    """Returns hash of the given arrays, strings and numbers. It is used as a key of the persistent cache."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, array):
+            digest.update(part.typecode.encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def find_program(name):
+    """Returns path of the program found in PATH or None. The program is not started."""
+    return shutil.which(name)
+
+def require_program(name):
+    """Stops the script if the program is not installed."""
+    if not find_program(name):
+        error("'{}' is not installed.".format(name))
+
+def program_features(settings, name):
+    """Returns path, version and features of the installed program (see 'PROGRAM_PROBES'), None for those that are unknown.
+
+    Each program is probed only once, the results are kept in the cache by the path, modification time and size
+    of the program. Returns None if the program is not installed.
+    """
+    path = find_program(name)
+    if not path:
+        return None
+    stat = os.stat(path)
+    key = content_key(path, stat.st_mtime_ns, stat.st_size)
+    with PROGRAMS_LOCK:
+        if key in PROGRAMS:
+            return PROGRAMS[key]
+
+    programs_dir = cache_directory(settings, "programs")
+    features = None
+    if programs_dir:
+        try:
+            with open(os.path.join(programs_dir, key), "r", encoding = "utf-8") as features_file:
+                features = json.load(features_file)
+            os.utime(os.path.join(programs_dir, key), None)
+        except (OSError, ValueError):
+            features = None
+    if features is None:
+        verbose("Probing features of '{}'.".format(path), settings["verbose"], 2)
+        features = probe_program(path, name)
+        if programs_dir:
+            try:
+                write_file(os.path.join(programs_dir, key), json.dumps(features).encode())
+            except OSError:
+                pass
+
+    with PROGRAMS_LOCK:
+        PROGRAMS[key] = features
+    return features
+
+def probe_program(path, name):
+    """Runs the probes of the program. Returns its path, version and lists of its features."""
+    features = { "path": path }
+    for feature, arguments in sorted(PROGRAM_PROBES[name].items()):
+        try:
+            proc = subprocess.Popen([ path ] + arguments, stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+        except OSError:
+            features[feature] = None
+            continue
+        try:
+            output = proc.communicate(timeout = PROBE_TIMEOUT)[0]
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            output = proc.communicate()[0]
+        output = output.decode(errors = "replace")
+        if feature == "version":
+            features[feature] = output.strip().split("\n")[0] or None
+        else:
+            "Output that does not list any feature says nothing about them."
+            features[feature] = FEATURE_PATTERNS[feature].findall(output) or None
+    return features
+
+def require_feature(settings, name, feature, value):
+    """Stops the script if the program is known not to have the feature (e.g. an encoder or a terminal)."""
+    features = program_features(settings, name)
+    if features and features.get(feature) is not None and value not in features[feature]:
+        error("'{}' ({}) has no '{}' in its {}.".format(name, features["version"], value, feature))
+
+def directory_size(path):
+    """Returns size of all files in the directory and its subdirectories."""
+    return os.path.getsize(path) + sum([ os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(path) for f in files ])
+
+def prune_cache(settings):
+    """Removes least recently used entries of the persistent cache until it fits into its size limit."""
+    if not settings["cache"] or not os.path.isdir(settings["cache_dir"]):
+        return
+    entries = []
+    for kind in os.listdir(settings["cache_dir"]):
+        kind_dir = os.path.join(settings["cache_dir"], kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        for name in os.listdir(kind_dir):
+            "Hidden entries are being written by running renders."
+            if name.startswith("."):
+                continue
+            path = os.path.join(kind_dir, name)
+            try:
+                size = directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+
+    total = sum([ size for mtime, size, path in entries ])
+    for mtime, size, path in sorted(entries):
+        if total <= settings["cache_size"] * 1024 * 1024:
+            break
+        verbose("Removing '{}' from the cache.".format(path), settings["verbose"], 2)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors = True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+def write_series(path, series):
+    """Saves series to the binary file - header followed by the arrays of times and values."""
+    header = struct.pack(SERIES_HEADER, SERIES_MAGIC, series.times.typecode.encode(), series.values.typecode.encode(), len(series))
+    write_file(path, header + series.times.tobytes() + series.values.tobytes())
+
+def read_series(path):
+    """Loads series saved by 'write_series'. Returns None if the file is missing or damaged."""
+    try:
+        with open(path, "rb") as series_file:
+            content = series_file.read()
+        magic, times_type, values_type, count = struct.unpack_from(SERIES_HEADER, content)
+        if magic != SERIES_MAGIC:
+            return None
+        series = Series(array(times_type.decode()), array(values_type.decode()))
+        start = struct.calcsize(SERIES_HEADER)
+        middle = start + count * series.times.itemsize
+        series.times.frombytes(content[start:middle])
+        series.values.frombytes(content[middle:middle + count * series.values.itemsize])
+    except (OSError, struct.error, ValueError):
+        return None
+    if len(series.values) != count:
+        return None
+    os.utime(path, None)
+    return series
+
+def write_file(path, content):
+    """Writes the file at once, readers never see a partially written file."""
+    fd, tmp_path = tempfile.mkstemp(prefix = ".", dir = os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+def download_file(url, cache_dir):
+    """Downloads the file. If it is cached the server is asked only for changes (ETag, Last-Modified)."""
+    import urllib.request
+    from urllib.error import HTTPError
+    request = urllib.request.Request(url)
+    meta = {}
+    if cache_dir:
+        path = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+        try:
+            with open(path + ".json", encoding = "utf-8") as meta_file:
+                meta = json.load(meta_file)
+            if meta.get("etag"):
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("last_modified"):
+                request.add_header("If-Modified-Since", meta["last_modified"])
+        except (OSError, ValueError):
+            meta = {}
+
+    try:
+        with urllib.request.urlopen(request) as i_file:
+            content = i_file.read()
+            headers = i_file.info()
+    except HTTPError as e:
+        if e.code != 304 or not meta:
+            raise
+        "Not modified - the cached copy is used."
+        try:
+            with open(path, "rb") as cached_file:
+                return cached_file.read()
+        except OSError:
+            return download_file(url, None)
+
+    if cache_dir and (headers.get("ETag") or headers.get("Last-Modified")):
+        try:
+            write_file(path, content)
+            meta = { "url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified") }
+            write_file(path + ".json", json.dumps(meta).encode())
+        except OSError:
+            pass
+    return content
+
+def is_url(input_file):
+    """Checks if the input file should be downloaded."""
+    return "http" in input_file
+
+def start_downloads(settings, executor):
+    """Starts downloading all remote input files. Returns futures of their contents by the URL."""
+    urls = [ input_file for input_file in settings["input"][0] if is_url(input_file) ]
+    cache_dir = cache_directory(settings, "http") if urls else None
+    downloads = {}
+    for input_file in urls:
+        verbose("Downloading file '{}'".format(input_file), settings["verbose"], 2)
+        downloads[input_file] = executor.submit(download_file, input_file, cache_dir)
+    return downloads
+
+def load_downloads(settings, downloads):
+    """Waits for the downloads in the order of the input files. Yields URL and its lines in chunks."""
+    from urllib.error import URLError, HTTPError
+    for input_file in settings["input"][0]:
+        if input_file not in downloads:
+            continue
+        try:
+            content = downloads[input_file].result()
+        except HTTPError as e:
+            soft_error("ERROR: The server couldn\'t fulfill the request.", settings["verbose"], 1, settings["ignore_error"])
+            verbose(" - error code: {}".format(e.code), settings["verbose"], 1)
+            continue
+        except URLError as e:
+            soft_error("ERROR: We failed to reach a server.", settings["verbose"], 1, settings["ignore_error"])
+            verbose(" - reason: {}".format(e.reason), settings["verbose"], 1)
+            continue
+        if content:
+            yield input_file, read_chunks(content)
+
+def generate_video(settings, digits, tmp_dir, first = 1, segment = None, codec = None, video = None):
+    """Creates target directory and generates video (using ffmpeg).
+
+    If 'segment' is set the PNG frames from 'first' on are copied (or encoded by the codec) into the video segment
+    with this suffix instead. If 'video' is set it is written to this path and no target directory is created.
+    """
+    video = video or create_target_directory(settings, video_suffix(settings, segment))
+    input_options, output_options = video_options(settings, segment, codec or [ "-c", "copy" ])
 
     print("Generating video...")
-    cmd = ''.join(('ffmpeg -i "{}/%0{}d.png"'.format(tmp_dir, digits),
-                  ' -r {}'.format(settings["fps"]),
-                  ' {}/{}'.format(settings["name"], video_name)))
+    cmd = ''.join(('ffmpeg',
+                  ' -start_number {}'.format(first) if first != 1 else '',
+                  ''.join([ ' ' + option for option in input_options ]),
+                  ' -i "{}/%0{}d.png"'.format(tmp_dir, digits),
+                  ''.join([ ' ' + option for option in output_options ]),
+                  ' {}'.format(video)))
     proc = subprocess.Popen(shlex.split(cmd), stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
-    output = proc.communicate()[0].decode()
+    with PROFILE.stage("ffmpeg_wait"):
+        output = proc.communicate()[0].decode()
 
     verbose(output, settings["verbose"], 2)
     
-    return "Video generated: '{}/{}'".format(settings["name"], video_name)
+    return "Video generated: '{}'".format(video)
+
+def video_suffix(settings, segment):
+    """Returns suffix of the video file name."""
+    if segment:
+        return segment
+    return ".preview.mp4" if settings["preview"] else ".mp4"
+
+def video_options(settings, segment, codec):
+    """Returns ffmpeg options of the input frames and of the output video.
+
+    Segments are stored by the given codec. Preview keeps the duration of the full video with every N-th frame
+    and is encoded by the fastest preset.
+    """
+    if segment:
+        return [], codec
+    if settings["preview"]:
+        return [ "-framerate", "25/{}".format(settings["preview"]) ], [ "-r", "{}/{}".format(settings["fps"], settings["preview"]), "-preset", "ultrafast" ]
+    return [], [ "-r", str(settings["fps"]) ]
+
+def open_video_stream(settings, input_format, segment = None, codec = None, video = None):
+    """Creates target directory and starts ffmpeg reading frames in the given format from its stdin.
+
+    If 'segment' is set the frames are stored by the codec into the video segment with this suffix.
+    If 'video' is set it is written to this path and no target directory is created.
+    """
+    video = video or create_target_directory(settings, video_suffix(settings, segment))
+    input_options, output_options = video_options(settings, segment, codec)
+
+    print("Generating video...")
+    "ffmpeg output goes to a file, a full pipe would block it while we are still writing frames."
+    log = tempfile.TemporaryFile()
+    cmd = [ "ffmpeg" ] + input_format + input_options + [ "-i", "-" ] + output_options + [ video ]
+    try:
+        ffmpeg = subprocess.Popen(cmd, stdin = subprocess.PIPE, stdout = log, stderr = subprocess.STDOUT)
+    except OSError:
+        error("'ffmpeg' could not be started.")
+    return ffmpeg, log, video
+
+def close_video_stream(ffmpeg, log, video, status, settings):
+    """Closes ffmpeg input, waits until the video is finished and checks the result."""
+    try:
+        ffmpeg.stdin.close()
+    except BrokenPipeError:
+        pass
+    with PROFILE.stage("ffmpeg_wait"):
+        ffmpeg.wait()
+
+    log.seek(0)
+    verbose(log.read().decode(errors = "replace"), settings["verbose"], 2)
+    log.close()
+
+    if status:
+        error(status[0])
+    if ffmpeg.returncode != 0:
+        error("ffmpeg failed while generating the video (exit code {}).".format(ffmpeg.returncode))
+
+    return "Video generated: '{}'".format(video)
+
+def prepare_animation(res_output, ymin, ymax, settings):
+    """Prepares everything needed to compute positions of the circles in any frame.
+
+    For each series returns the series, start positions of its circles and numbers of frames in which they appear.
+    """
+    animation = [ (Series(array('d')), array('d'), array('q')) for i_data in res_output ]
+    return extend_animation(animation, res_output, ymin, ymax, settings)
+
+def extend_animation(animation, res_output, ymin, ymax, settings, frame = 1):
+    """Adds circles of the selected data to the end of each series of the animation.
+
+    New circles never appear before the given frame, if they are late all following circles are shifted as well.
+    """
+    delay = int(settings["delay"])
+    speed = int(settings["speed"])
+    "Circle with index 'n' appears once 'frame * speed' reaches 'n * delay'."
+    appear = lambda index: max(1, -(-index * delay // speed))
+    for (i_data, base, first), new_data in zip(animation, res_output):
+        shift = first[-1] - appear(len(first) - 1) if len(first) else 0
+        shift = max(shift, frame - appear(len(first)))
+        first.extend([ appear(index) + shift for index in range(len(first), len(first) + len(new_data)) ])
+        base.extend([ ymin if value < 0 else ymax for value in new_data.values ])
+        i_data.extend(new_data)
+    return animation
+
+def animation_end(animation, jump):
+    """Returns number of the frame in which the last circle of the animation reaches its position."""
+    last = 0
+    for i_data, base, first in animation:
+        for target, start, appears in zip(i_data.values, base, first):
+            last = max(last, appears - 1 + max(1, int(math.ceil(math.fabs(start - target) / jump))))
+    return last
+
+def circle_position(target, base, moves, jump):
+    """Returns position of the circle after the given number of moves from its start towards its target value."""
+    direction = -1 if target < 0 else 1
+    val = base - direction * jump * moves
+    if direction * val <= direction * target:
+        return target
+    return val
+
+def move_circles(animation, positions, frame, jump):
+    """Moves the circles of each series in 'positions' to the given frame (numbered from 1), in place.
+
+    Returns True if any circle moved or appeared since the frame the positions were set to before.
+    """
+    changed = False
+    for (i_data, base, first), values in zip(animation, positions):
+        visible = bisect.bisect_right(first, frame)
+        if len(values) < visible:
+            changed = True
+            values.extend(base[len(values):visible])
+        for index in range(visible):
+            val = circle_position(i_data.values[index], base[index], frame - first[index] + 1, jump)
+            if values[index] != val:
+                values[index] = val
+                changed = True
+    return changed
+
+def frame_total(real_frames, settings):
+    """Returns number of the generated frames."""
+    return int(math.ceil(real_frames / int(settings["speed"])))
+
+def generate_frames(animation, jump, real_frames, settings, first = 1, last = None, step = 1):
+    """Generates every 'step'-th frame from 'first' to 'last'.
+
+    Yields frame number and state of the frame, a (times, values) pair of each series, values of the visible
+    circles only. The state is None if the frame is the same as the previous one. The first generated frame
+    always has its state. The values are updated in place for the next frame, so the state must be used
+    before the next frame is generated.
+    """
+    if last is None:
+        last = frame_total(real_frames, settings)
+
+    positions = [ array('d') for i_data, base, first_frames in animation ]
+    state = [ (i_data.times, values) for (i_data, base, first_frames), values in zip(animation, positions) ]
+    for counter in range(first, last + 1, step):
+        percentage_done((counter - 1) * int(settings["speed"]) + 1, real_frames)
+        with PROFILE.stage("generate_frames"):
+            changed = move_circles(animation, positions, counter, jump)
+        if not changed and counter != first:
+            "Nothing moved and no circle appeared - the previous frame is reused instead of rendering it again."
+            PROFILE.count("frames_duplicated")
+            yield counter, None
+            continue
+        PROFILE.count("frames_rendered")
+        yield counter, state
+
+class GnuplotRenderer(object):
+    """Renders frames as PNG images by persistent gnuplot processes.
+
+    Frames are dealt round-robin to the processes. If 'pipe' is set gnuplot writes the images to its stdout
+    and 'result' returns them in the order in which the frames were submitted.
+    """
+    ffmpeg_input = [ "-f", "image2pipe" ]
+    segment_codec = [ "-c", "copy" ]
+
+    def __init__(self, scene, settings, pipe):
+        self.plot = ""
+        for index in range(0, scene["series"]):
+            if index == 0:
+                self.plot += 'plot'
+            else:
+                self.plot += ','
+
+            self.plot += ' "-" u 1:2 w p ls {}'.format(index + 1)
+        self.plot = (self.plot + "\n").encode()
+
+        self.gnuplots = [ open_gnuplot(scene["gnuplot"], subprocess.PIPE if pipe else None) for job in range(settings["jobs"]) ]
+        self.rendered = 0
+        self.order = queue.Queue()
+        self.finished = set()
+        self.images = []
+        if pipe:
+            "One reader thread per process collects the images."
+            for gnuplot in self.gnuplots:
+                self.images.append(queue.Queue(8))
+                start_thread(collect_frames, gnuplot, self.images[-1])
+
+    def submit(self, state, path = None):
+        """Renders the frame into the file or to the pipe if no path is given."""
+        job = self.rendered % len(self.gnuplots)
+        self.rendered += 1
+
+        if not path:
+            self.order.put(job)
+        gnuplot = self.gnuplots[job]
+        try:
+            written = write_frame(gnuplot.stdin, self.plot, state, path)
+            gnuplot.stdin.flush()
+        except BrokenPipeError:
+            error("gnuplot terminated unexpectedly (exit code {}).".format(gnuplot.wait()))
+        PROFILE.count("bytes_to_gnuplot", written)
+
+    def result(self):
+        """Returns image of the next submitted frame. Returns None if gnuplot stopped before rendering it."""
+        job = self.order.get()
+        if job in self.finished:
+            return None
+        image = self.images[job].get()
+        if image is None:
+            self.finished.add(job)
+        return image
+
+    def close(self):
+        """Waits until gnuplot writes out all frames."""
+        for gnuplot in self.gnuplots:
+            close_gnuplot(gnuplot)
+
+class RasterRenderer(object):
+    """Draws frames in-process into a copy of the static background (axes, tics, title).
+
+    The background is rendered by gnuplot only once, circles are then drawn straight into the RGB framebuffer
+    and raw frames are passed to ffmpeg. Only the settings of the preamble that shape the background are used.
+    """
+
+    def __init__(self, scene, settings, pipe):
+        self.background, self.width, self.height, area, palette = render_background(scene["gnuplot"])
+        self.ffmpeg_input = [ "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(self.width, self.height) ]
+        self.segment_codec = [ "-c:v", "png" ]
+        self.left, self.right, self.bottom, self.top = area
+        self.xmin, self.xmax = scene["xrange"]
+        self.ymin, self.ymax = scene["yrange"]
+        self.colors = [ palette.get(color, b"\x00\x00\x00") for color in scene["colors"] ]
+        self.markers = [ MARKERS[index % len(MARKERS)] for index in range(scene["series"]) ]
+        "Drawing waits for ffmpeg if it falls behind, only a few frames are kept in the memory."
+        self.images = queue.Queue(8)
+
+    def draw(self, state):
+        """Returns the frame as raw RGB image."""
+        image = bytearray(self.background)
+        width = self.width
+        x_scale = (self.right - self.left) / (self.xmax - self.xmin) if self.xmax != self.xmin else 0
+        y_scale = (self.top - self.bottom) / (self.ymax - self.ymin) if self.ymax != self.ymin else 0
+        for (times, values), color, marker in zip(state, self.colors, self.markers):
+            for t, val in zip(times, values):
+                "Points out of the ranges are not drawn, the same as gnuplot does."
+                if not self.xmin <= t <= self.xmax or not self.ymin <= val <= self.ymax:
+                    continue
+                x = int(round(self.left + (t - self.xmin) * x_scale))
+                y = self.height - 1 - int(round(self.bottom + (val - self.ymin) * y_scale))
+                for dx, dy in marker:
+                    if self.left <= x + dx <= self.right and self.height - 1 - self.top <= y + dy <= self.height - 1 - self.bottom:
+                        offset = ((y + dy) * width + x + dx) * 3
+                        image[offset:offset + 3] = color
+        return image
+
+    def submit(self, state, path = None):
+        """Draws the frame into the PNG file or keeps it for 'result' if no path is given."""
+        if path:
+            self.save(self.draw(state), path)
+        else:
+            self.images.put(self.draw(state))
+
+    def result(self):
+        """Returns image of the next submitted frame."""
+        return self.images.get()
+
+    def save(self, image, path):
+        """Saves raw image as PNG file."""
+        with open(path, "wb") as frame_file:
+            frame_file.write(encode_png(image, self.width, self.height))
+
+    def close(self):
+        """Nothing is running in the background."""
+        pass
+
+def write_frame(stream, plot, state, path = None):
+    """Writes gnuplot script of one frame straight to the binary stream. Returns number of the written bytes.
+
+    The plot command is already encoded and only one row is formatted at a time, so no part of the script
+    grows with the number of the circles.
+    """
+    written = 0
+    if path:
+        written += stream.write('set output "{}"\n'.format(path).encode())
+    written += stream.write(plot)
+    for times, values in state:
+        for t, val in zip(times, values):
+            written += stream.write(ROW_FORMAT.format(t, val).encode())
+        written += stream.write(END_OF_DATA)
+    return written
+
+def open_renderer(scene, settings, pipe):
+    """Creates renderer selected in the settings."""
+    require_feature(settings, "gnuplot", "terminals", "png")
+    if settings["renderer"] == "raster":
+        return RasterRenderer(scene, settings, pipe)
+    return GnuplotRenderer(scene, settings, pipe)
+
+def render_background(general_gnuplot):
+    """Renders the graph without any circle by gnuplot.
+
+    Returns the image as raw RGB data, its size, borders of the plot area in pixels (left, right, bottom, top)
+    and RGB values of the gnuplot color names.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "background.png")
+        script = general_gnuplot
+        script += 'set output "{}"\n'.format(path)
+        "A point with zero size keeps the plot valid without drawing anything."
+        script += 'plot "-" u 1:2 w p ps 0 notitle\n0 0\ne\n'
+        script += 'set output\n'
+        script += 'set print "-"\n'
+        script += 'print GPVAL_TERM_XMIN, GPVAL_TERM_XMAX, GPVAL_TERM_YMIN, GPVAL_TERM_YMAX, (exists("GPVAL_TERM_SCALE") ? GPVAL_TERM_SCALE : 1)\n'
+        script += 'show colornames\n'
+        try:
+            gnuplot = subprocess.Popen(["gnuplot"], stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        except OSError:
+            error("'gnuplot' could not be started.")
+        PROFILE.count("bytes_to_gnuplot", len(script))
+        with PROFILE.stage("gnuplot_wait"):
+            output, colornames = gnuplot.communicate(script.encode())
+
+        try:
+            with open(path, "rb") as png_file:
+                width, height = struct.unpack(">II", png_file.read(24)[16:24])
+            ffmpeg = subprocess.Popen([ "ffmpeg", "-v", "error", "-i", path, "-f", "rawvideo", "-pix_fmt", "rgb24", "-" ], stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+            background = ffmpeg.communicate()[0]
+            left, right, bottom, top, scale = [ float(value) for value in output.split()[-5:] ]
+        except (OSError, ValueError, struct.error):
+            error("background of the graph could not be rendered.")
+
+    if len(background) != width * height * 3:
+        error("background of the graph could not be decoded.")
+
+    palette = {}
+    for line in colornames.decode(errors = "replace").split("\n"):
+        match = re.match(r"\s*(\S+)\s+#([0-9a-fA-F]{6})", line)
+        if match:
+            palette[match.group(1)] = bytes.fromhex(match.group(2))
+
+    area = [ int(round(value / scale)) for value in (left, right, bottom, top) ]
+    return background, width, height, area, palette
+
+def marker(shape, size = 3):
+    """Returns pixels (offsets from the center) of the point marker."""
+    pixels = []
+    for dx in range(-size, size + 1):
+        for dy in range(-size, size + 1):
+            distance = math.hypot(dx, dy)
+            if shape == "plus" and (dx == 0 or dy == 0) \
+                    or shape == "cross" and abs(dx) == abs(dy) \
+                    or shape == "star" and (dx == 0 or dy == 0 or abs(dx) == abs(dy)) \
+                    or shape == "box" and max(abs(dx), abs(dy)) == size \
+                    or shape == "filled_box" \
+                    or shape == "circle" and size - 0.5 <= distance <= size + 0.5 \
+                    or shape == "filled_circle" and distance <= size + 0.5:
+                pixels.append((dx, dy))
+    return pixels
+
+def png_chunk(kind, data):
+    """Returns PNG chunk with its length and checksum."""
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+def encode_png(image, width, height):
+    """Encodes raw RGB image to PNG."""
+    stride = width * 3
+    view = memoryview(image)
+    raw = b"".join([ part for row in range(height) for part in (b"\x00", view[row * stride:(row + 1) * stride]) ])
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        png_chunk(b"IDAT", zlib.compress(raw, 1)),
+        png_chunk(b"IEND", b"")
+    ])
+
+def render_frames(renderer, frames, tmp_dir, digits):
+    """Renders all frames as PNG files into the temporary directory."""
+    duplicates = []
+    source = None
+    for counter, state in frames:
+        if state is None:
+            if source is None:
+                error("the first frame can not repeat a previous one.")
+            duplicates.append((source, counter))
+            continue
+        source = counter
+        renderer.submit(state, frame_path(tmp_dir, counter, digits))
+
+    "Waits until all frames are written so ffmpeg does not miss any of them."
+    renderer.close()
+
+    for source, counter in duplicates:
+        copy_frame(frame_path(tmp_dir, source, digits), frame_path(tmp_dir, counter, digits))
+    print("All frames generated.")
+
+def frame_path(tmp_dir, counter, digits):
+    """Returns path of the frame image."""
+    return "{0}/{1:0{2}d}.png".format(tmp_dir, counter, digits)
+
+def copy_frame(source, target):
+    """Copies image of the frame, hard link is used if possible."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def stream_video(settings, renderer, frames, segment = None, codec = None, video = None):
+    """Renders all frames and pipes them straight to ffmpeg while they are being generated.
+
+    If 'segment' is set the frames are saved into the video segment with this suffix instead of the final video,
+    losslessly unless the codec is given.
+    """
+    ffmpeg, log, video = open_video_stream(settings, renderer.ffmpeg_input, segment, codec or renderer.segment_codec, video)
+
+    "Frames have to reach ffmpeg in order, the muxer takes them in the order they were submitted."
+    order = queue.Queue()
+    status = []
+    muxer = start_thread(mux_frames, order, renderer, ffmpeg, status)
+
+    rendered = False
+    for counter, state in frames:
+        if state is None:
+            if not rendered:
+                error("the first frame can not repeat a previous one.")
+            order.put((counter, DUPLICATE))
+            continue
+        rendered = True
+        order.put((counter, RENDERED))
+        renderer.submit(state)
+    order.put(None)
+
+    renderer.close()
+    muxer.join()
+    print("All frames generated.")
+
+    return close_video_stream(ffmpeg, log, video, status, settings)
+
+def start_thread(target, *args):
+    """Starts a daemon thread."""
+    thread = threading.Thread(target = target, args = args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def read_png(stream):
+    """Reads one PNG image from the stream. Returns None at the end of the stream."""
+    chunks = [ stream.read(8) ]
+    if len(chunks[0]) < 8:
+        return None
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return None
+        chunks.append(header)
+        chunks.append(stream.read(struct.unpack(">I", header[:4])[0] + 4))
+        if header[4:] == b"IEND":
+            return b"".join(chunks)
+
+def collect_frames(gnuplot, images):
+    """Reads images rendered by one gnuplot process and puts them into the queue."""
+    while True:
+        image = read_png(gnuplot.stdout)
+        images.put(image)
+        if image is None:
+            return
+
+def mux_frames(order, renderer, ffmpeg, status):
+    """Writes frames to ffmpeg in the order they were submitted to the renderer."""
+    image = None
+    for counter, job in iter(order.get, None):
+        if job != DUPLICATE:
+            image = renderer.result()
+            if image is None:
+                status.append("gnuplot stopped before all frames were rendered.")
+                continue
+        if status:
+            "Keeps draining the renderer so it is never blocked."
+            continue
+        PROFILE.count("bytes_to_ffmpeg", len(image))
+        try:
+            ffmpeg.stdin.write(image)
+        except BrokenPipeError:
+            status.append("ffmpeg terminated unexpectedly.")
+
+MARKERS.extend([ marker(shape) for shape in [ "plus", "cross", "star", "box", "filled_box", "circle", "filled_circle" ] ])
+
+def prepare_scene(series, colors, xrange, yrange, settings, constants):
+    """Returns everything the renderers need to draw the frames - gnuplot preamble, colors and ranges of the axes."""
+    xmin, xmax = xrange
+    ymin, ymax = yrange
+    yrange = set_y_range(settings["min_val"], settings["max_val"], ymin, ymax)
+
+    xtics = set_x_tics(xmin, xmax)
+
+    general_gnuplot = 'set term png truecolor\n\
+                       set key off\n\
+                       set xrange ["{xmin}":"{xmax}"] noreverse nowriteback\n\
+                       set yrange [{yrange}] noreverse nowriteback\n\
+                       unset autoscale\n\
+                       set xtics rotate by -45 scale 1 font ",10" ({xtics})\n'\
+                       .format(xmin = xmin, xmax = xmax, yrange = yrange, xtics = xtics[0:len(xtics)-1])
+
+    if settings["preview"]:
+        general_gnuplot += 'set term png truecolor size {}\n'.format(constants["preview_size"])
+
+    if settings["gnuplot"]:
+        general_gnuplot += settings["gnuplot"]
+
+    if settings["legend"]:
+        general_gnuplot += 'set title "{legend}"\n'.format(legend = settings["legend"])
+
+    for index, color in enumerate(colors):
+        general_gnuplot += 'set style line {} lc rgb "{}"\n'.format(index + 1, color, index + 3)
+
+    return {
+        "gnuplot": general_gnuplot,
+        "series": series,
+        "colors": colors,
+        "xrange": (xmin, xmax),
+        "yrange": (ymin, ymax)
+    }
 
 def process_data(data, settings, constants):
-    """Calculates all needed values and generates all frames."""
+    """Calculates all needed values and generates all frames. Returns message about the generated video."""
     print("Processing data and generating all frames...")
     count = 0
     xmax = None
@@ -535,7 +2573,7 @@ def process_data(data, settings, constants):
         xmin = get_min_date(i_data, xmin)
 
         "Counts # of input values."
-        count += math.ceil((i_data.count("\n")+1)/2)
+        count += math.ceil(len(i_data)/2)
 
     if not settings["columns"]:
         settings["columns"] = count if count <= constants["max_columns"] else constants["max_columns"]
@@ -556,11 +2594,7 @@ def process_data(data, settings, constants):
     "Counts size of the jump - how much the circle should move each step."
     jump = (ymax - ymin) / settings["steps"]
 
-    "If the minimal and maximal values are not set 'ymax' and 'ymin' are adjusted to create a gap in the top and bottom of the graph."
-    if settings["max_val"] == "max":
-        ymax = 0 if ymax <= 0 and ymax + 20 * jump > 0 else ymax + 20 * jump
-    if settings["min_val"] == "min":
-        ymin = 0 if ymin >= 0 and ymin - 20 * jump < 0 else ymin - 20 * jump
+    ymin, ymax = pad_y_range(ymin, ymax, jump, settings)
 
     frames = None
     for i_data in res_output:
@@ -578,105 +2612,180 @@ def process_data(data, settings, constants):
 
     digits = len(str(real_frames))
 
-    yrange = set_y_range(settings["min_val"], settings["max_val"], ymin, ymax)
-
-    xtics = set_x_tics(xmin, xmax)
-
-    general_gnuplot = 'set term png truecolor\n\
-                       set key off\n\
-                       set xrange ["{xmin}":"{xmax}"] noreverse nowriteback\n\
-                       set yrange [{yrange}] noreverse nowriteback\n\
-                       unset autoscale\n\
-                       set xtics rotate by -45 scale 1 font ",10" ({xtics})\n'\
-                       .format(xmin = xmin, xmax = xmax, yrange = yrange, xtics = xtics[0:len(xtics)-1])
-
-    if settings["gnuplot"]:
-        general_gnuplot += settings["gnuplot"]
-
-    if settings["legend"]:
-        general_gnuplot += 'set title "{legend}"\n'.format(legend = settings["legend"])
+    "Colors are chosen by the content of the data, the same data always get the same colors."
+    data_key = content_key(*[ column for i_data in res_output for column in (i_data.times, i_data.values) ])
+    selected_colors = select_colors(len(res_output), settings, constants, data_key)
+
+    scene = prepare_scene(len(res_output), selected_colors, (xmin, xmax), (ymin, ymax), settings, constants)
+    general_gnuplot = scene["gnuplot"]
+
+    animation = prepare_animation(res_output, ymin, ymax, settings)
+    frames = generate_frames(animation, jump, real_frames, settings)
+
+    if settings["preview"]:
+        frames = generate_frames(animation, jump, real_frames, settings, step = settings["preview"])
+        "Frames of the preview are numbered one after another."
+        frames = ((index, state) for index, (counter, state) in enumerate(frames, 1))
+        with PROFILE.stage("render_video"):
+            message = render_preview(settings, constants, scene, frames, real_frames, digits)
+        print(message)
+        return message
+
+    if settings["frames"]:
+        first, last = settings["frames"]
+        last = min(last or frame_total(real_frames, settings), frame_total(real_frames, settings))
+        if first > last:
+            error("'frames' out of range, the animation has only {} frames.".format(frame_total(real_frames, settings)))
+        frames = generate_frames(animation, jump, real_frames, settings, first, last)
+        with PROFILE.stage("render_video"):
+            message = render_segment(settings, constants, scene, frames, first, last, real_frames, digits)
+        print(message)
+        return message
+
+    frames_key = content_key(data_key, ymin, ymax, jump, general_gnuplot, settings["renderer"], settings["delay"], int(settings["speed"]), real_frames, digits)
+    with PROFILE.stage("render_video"):
+        message = render_video(settings, constants, scene, frames, real_frames, digits, frames_key)
+    print(message)
+    return message
+
+def follow_video(settings, constants):
+    """Renders the animation as HLS video segments and extends it while data are appended to the input files.
+
+    Input files are checked every 'follow' seconds, only the appended lines are parsed and only the frames
+    of the new circles are rendered. Runs until it is interrupted. Returns message about the generated playlist.
+    """
+    require_feature(settings, "ffmpeg", "encoders", "libx264")
+    options = { key: settings[key] for key in [ "time_format", "min_time", "max_time" ] }
+    if not settings["speed"]:
+        verbose("WARNING: speed can not be computed from the length of a growing animation.", settings["verbose"], 1)
+        verbose(" - Using default value.", settings["verbose"], 1)
+        settings["speed"] = constants["speed"]
 
-    partial_out = []
-    selected_colors = []
+    print("Loading input files data...")
+    "Every local file is followed, even if it has no data yet. 'series' is index of its series once it has some."
+    tails = {}
+    for file_name in settings["input"][0]:
+        if is_url(file_name):
+            soft_error("WARNING: remote file '{}' can not be followed.".format(file_name), settings["verbose"], 1, settings["ignore_error"])
+            verbose(" - skipping", settings["verbose"], 1)
+            continue
+        tails[file_name] = { "offset": 0, "lines": 0, "rows": Series(), "series": None }
 
-    for index, i_data in enumerate(res_output):
-        partial_out.append([])
-        for line in i_data.split("\n"):
-            if line == "":
-                continue
-            time, value = line.split()
-            if float(value) < 0:
-                partial_out[index].append("{} {}".format(time, ymin))
-            else:
-                partial_out[index].append("{} {}".format(time, ymax))
+    if not tails:
+        error("ERROR: No suitable data found in any of the input files.")
 
-        if "colors" not in settings:
-            tmp = constants["colors"][random.randrange(len(constants["colors"]))]
-            while tmp in selected_colors:
-                tmp = constants["colors"][random.randrange(len(constants["colors"]))]
-            selected_colors.append(tmp)
+    "Geometry of the graph needs data of at least two different times, files are read until they have them."
+    waiting = False
+    try:
+        while True:
+            for file_name, tail in tails.items():
+                rows = tail["rows"]
+                rows.extend(read_appended(file_name, tail, rows.times[-1] if len(rows) else None, options, settings))
+            suitable_data = [ tail["rows"] for tail in tails.values() if len(tail["rows"]) ]
+            if suitable_data and max([ rows.times[-1] for rows in suitable_data ]) > min([ rows.times[0] for rows in suitable_data ]):
+                break
+            if not waiting:
+                print("Waiting for input data...")
+                waiting = True
+            time.sleep(settings["follow"])
+    except KeyboardInterrupt:
+        error("ERROR: No suitable data found in any of the input files.")
+
+    "Rows not yet in a complete column, appended rows of each file go to its series."
+    pending = merge_data(suitable_data, settings)
+    "Files merged into one series are not among the merged series."
+    positions = { id(i_data): index for index, i_data in enumerate(pending) }
+    for file_name, tail in tails.items():
+        if len(tail["rows"]):
+            tail["series"] = positions.get(id(tail["rows"]), 0)
         else:
-            tmp = settings["colors"][random.randrange(len(settings["colors"]))]
-            while tmp in selected_colors:
-                if len(selected_colors) >= len(res_output):
-                    tmp = constants["colors"][random.randrange(len(constants["colors"]))]
-                else:
-                    tmp = settings["colors"][random.randrange(len(settings["colors"]))]
-            selected_colors.append(tmp)
-
-        general_gnuplot += 'set style line {} lc rgb "{}"\n'.format(index + 1, selected_colors[index], index + 3)
-
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        i = int(settings["delay"])
-        counter = 0
-        while i < real_frames + settings["delay"]:
-            percentage_done(i - settings["delay"] + 1, real_frames)
-            i += int(settings["speed"])
-            counter += 1
-            k = i / settings["delay"]
-            effect_data = []
-
-            gnuplot_settings = general_gnuplot
-            gnuplot_settings += 'set output "{0}/{1:0{2}d}.png"\n'.format(tmp_dir, counter, digits)
-
-            for index in range(0, len(res_output)):
-                if index == 0:
-                    gnuplot_settings += 'plot'
-                else:
-                    gnuplot_settings += ','
-
-                gnuplot_settings += ' "-" u 1:2 w p ls {}'.format(index + 1)
-            gnuplot_settings += "\n"
-
-            for index, i_data in enumerate(res_output):
-                effect_data.append("")
-                for index_line, line in enumerate(i_data.split("\n")):
-                    if line == "" or index_line + 1 > k:
-                        continue
-                    time, value = line.split()
-                    value = float(value)
-                    partial_time, partial_value = partial_out[index][index_line].split()
-                    partial_value = float(partial_value)
-
-                    "'value' is a target value"
-                    tmp = -1 if value < 0 else 1
-
-                    "'partial_value' is a value for the current frame"
-                    val = partial_value - tmp * jump
-
-                    if math.fabs(val) <= math.fabs(value) or (val > 0 and value < 0) or (val < 0 and value > 0):
-                        val = value
-
-                    partial_out[index][index_line] = "{} {}".format(partial_time, val)
-                    effect_data[index] += "{} {}\n".format(partial_time, val)
-                    
-                gnuplot_settings += effect_data[index]
-                gnuplot_settings += 'e\n'
+            verbose("File '{}' has no suitable data yet, it gets its own curve once it has some.".format(file_name), settings["verbose"], 1)
+        del tail["rows"]
+    origins = [ i_data.times[0] for i_data in pending ]
+    prev = [ i_data.times[-1] for i_data in pending ]
+    xmin = min(origins)
+    xmax = max(prev)
+
+    "Width of the columns is given by the data at the start and does not change later."
+    count = sum([ math.ceil(len(i_data) / 2) for i_data in pending ])
+    if not settings["columns"]:
+        settings["columns"] = count if count <= constants["max_columns"] else constants["max_columns"]
+    distance = (xmax - xmin) / settings["columns"]
+    if distance <= 0:
+        error("ERROR: data of at least two different times are needed to follow them.")
 
-            gnuplot = subprocess.Popen(["gnuplot", "-persist"], stdin=subprocess.PIPE).stdin         
-            gnuplot.write(gnuplot_settings.encode())
-            gnuplot.flush()
+    "Colors are chosen by the followed files, they do not change while the data grow."
+    colors_seed = content_key(*sorted(tails))
+    colors = select_colors(len(pending), settings, constants, colors_seed)
 
-        print("All frames generated.")
+    playlist = create_target_directory(settings, ".m3u8")
+    segment_path = os.path.splitext(playlist)[0] + ".{:05d}.ts"
+    segments = []
+    target_duration = constants["segment_frames"] / IMAGE_FPS
 
-        print(generate_video(settings, digits, tmp_dir))
+    animation = [ (Series(array('d')), array('d'), array('q')) for i_data in pending ]
+    jump = None
+    ymin = None
+    ymax = None
+    rendered = 0
+    try:
+        while True:
+            closed = [ close_buckets(i_data, origin, distance, settings) for i_data, origin in zip(pending, origins) ]
+            new_data = [ res_output for res_output, taken in closed if len(res_output) ]
+            if new_data:
+                vmax = max([ value_range(res_output, settings)[0] for res_output in new_data ])
+                vmin = min([ value_range(res_output, settings)[1] for res_output in new_data ])
+                if jump is None and vmax != vmin:
+                    "Size of the moves is given by the first columns, the circles then move at the same speed."
+                    jump = (vmax - vmin) / settings["steps"]
+                    ymin, ymax = pad_y_range(vmin, vmax, jump, settings)
+                elif jump is not None:
+                    "New values out of the range extend it, circles already shown keep their start positions."
+                    ymin = min(ymin, pad_y_range(vmin, vmax, jump, settings)[0])
+                    ymax = max(ymax, pad_y_range(vmin, vmax, jump, settings)[1])
+
+            if new_data and jump is not None:
+                for index, (res_output, taken) in enumerate(closed):
+                    pending[index] = Series(pending[index].times[taken:], pending[index].values[taken:])
+                    PROFILE.count("buckets", len(res_output))
+                extend_animation(animation, [ res_output for res_output, taken in closed ], ymin, ymax, settings, rendered + 1)
+                last = animation_end(animation, jump)
+                scene = prepare_scene(len(animation), colors, (xmin, xmax), (ymin, ymax), settings, constants)
+
+                "Frames of the new circles are split into segments of the same length."
+                for first in range(rendered + 1, last + 1, constants["segment_frames"]):
+                    stop = min(last, first + constants["segment_frames"] - 1)
+                    frames = generate_frames(animation, jump, stop * int(settings["speed"]), settings, first, stop)
+                    video = segment_path.format(len(segments))
+                    with PROFILE.stage("render_video"):
+                        duration = render_live_segment(settings, constants, scene, frames, first, stop, video)
+                    segments.append((os.path.basename(video), duration))
+                    write_playlist(playlist, segments, target_duration)
+                    rendered = stop
+                print("Frames up to #{} rendered, waiting for new data...".format(rendered))
+
+            time.sleep(settings["follow"])
+            for file_name, tail in tails.items():
+                index = tail["series"]
+                rows = read_appended(file_name, tail, None if index is None else prev[index], options, settings)
+                if not len(rows):
+                    continue
+                if index is None:
+                    "Colors of the other series stay the same, the choice of the colors only continues."
+                    index = tail["series"] = len(pending)
+                    pending.append(Series())
+                    origins.append(rows.times[0])
+                    prev.append(None)
+                    animation.append((Series(array('d')), array('d'), array('q')))
+                    colors = select_colors(len(pending), settings, constants, colors_seed)
+                    xmin = min(xmin, rows.times[0])
+                pending[index].extend(rows)
+                prev[index] = rows.times[-1]
+                xmax = max(xmax, prev[index])
+    except KeyboardInterrupt:
+        pass
+
+    write_playlist(playlist, segments, target_duration, True)
+    message = "Video generated: '{}'".format(playlist)
+    print(message)
+    return message